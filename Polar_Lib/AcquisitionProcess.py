@@ -0,0 +1,105 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+
+import numpy as np
+
+from .LiveFeed import LiveFeed
+from .PolarLib import DeviceH10
+from .RecordingWriter import open_writer
+from .RestartPolicy import RestartPolicy
+from .SharedRingBuffer import SharedRingBuffer
+
+# Spawned rather than forked: the parent (a GUI) already runs threads, which fork() does not carry over safely.
+_CONTEXT = multiprocessing.get_context("spawn")
+
+
+class AcquisitionProcess:
+    """ DeviceH10 and the recording writer in a child process, so nothing the parent does can delay BLE handling.
+
+    The child feeds a `LiveFeed` whose display buffers are `SharedRingBuffer`s created here: `buffers` can be read
+    like the in-process ones, without copies through a pipe, and `get()` returns the latest status values. Errors
+    that end the acquisition are reported through `poll_error()`.
+    """
+
+    def __init__(self, mac_address: str, filepath: str, buffer_seconds: float = 600.0, client_factory=None):
+        self.mac_address = mac_address
+        self.filepath = filepath
+        self.buffers = LiveFeed.create_buffers(buffer_seconds, SharedRingBuffer)
+        self._status = _CONTEXT.RawArray("d", len(LiveFeed.STATUS_FIELDS))
+        # Read side of the child's feed: same status array, same buffers.
+        self.feed = LiveFeed(self.buffers, status=np.frombuffer(self._status))
+        self.feed.status[:] = np.nan
+        self._stop_event = _CONTEXT.Event()
+        self._errors = _CONTEXT.Queue()
+        specs = {name: buffer.spec for name, buffer in self.buffers.items()}
+        self._process = _CONTEXT.Process(target=_acquire, name="H10 acquisition " + mac_address, daemon=True,
+                                         args=(mac_address, filepath, specs, self._status, self._stop_event,
+                                               self._errors, client_factory))
+
+    @property
+    def is_alive(self) -> bool:
+        return self._process.is_alive()
+
+    def start(self):
+        self._process.start()
+
+    def get(self, field: str):
+        """ Latest value of a `LiveFeed.STATUS_FIELDS` field, None while unknown. """
+        return self.feed.get(field)
+
+    def poll_error(self):
+        """ Message of an error that ended the acquisition, or None. """
+        try:
+            return self._errors.get_nowait()
+        except queue.Empty:
+            return None
+
+    def stop(self, timeout: float = 2.0):
+        """ Disconnect, close the recording and end the child, then free the shared buffers. """
+        self._stop_event.set()
+        if self._process.pid is not None:
+            self._process.join(timeout)
+            if self._process.is_alive():
+                print("Acquisition process did not stop within {0} s, terminating it".format(timeout))
+                self._process.terminate()
+                self._process.join()
+        for buffer in self.buffers.values():
+            buffer.close()
+            buffer.unlink()
+
+
+def _acquire(mac_address, filepath, specs, status, stop_event, errors, client_factory):
+    """ Child process entry point. """
+    buffers = {name: SharedRingBuffer.attach(**spec) for name, spec in specs.items()}
+    try:
+        asyncio.run(_acquire_async(mac_address, filepath, buffers, np.frombuffer(status), stop_event,
+                                   client_factory))
+    except Exception as e:
+        errors.put(str(e))
+    finally:
+        for buffer in buffers.values():
+            buffer.close()
+
+
+async def _acquire_async(mac_address, filepath, buffers, status, stop_event, client_factory):
+    device = DeviceH10(mac_address, restart_policy=RestartPolicy(), client_factory=client_factory)
+    # Rows are written by a background thread so disk stalls never hold up BLE handling.
+    writer = open_writer(filepath, DeviceH10.ECG_SAMPLING_FREQUENCY)
+    device.received_data_cb = LiveFeed(buffers, writer, status)
+
+    loop = asyncio.get_running_loop()
+    # Acquisition health (packet rates, losses, timings) is appended next to the recording every 10 s.
+    telemetry_path = os.path.splitext(filepath)[0] + "_telemetry.jsonl"
+    telemetry = asyncio.ensure_future(device.telemetry.dump_periodically(telemetry_path, mac_address=mac_address))
+    stop_requested = loop.run_in_executor(None, stop_event.wait)
+    stop_requested.add_done_callback(lambda _: device.stop())
+    try:
+        await device.connect_async()
+    finally:
+        telemetry.cancel()
+        await asyncio.gather(telemetry, return_exceptions=True)
+        stop_event.set()  # Releases the waiting thread if the device stopped on its own
+        await stop_requested
+        await loop.run_in_executor(None, writer.close)
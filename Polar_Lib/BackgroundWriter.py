@@ -0,0 +1,105 @@
+import math
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class BackgroundWriter:
+    """ Base of the recording writers: batches of samples queued by `write()` and written by a background thread.
+
+    `write()` only enqueues, so the acquisition thread never waits on the disk. The writer thread holds the output
+    open (`_output()`), and hands the pending batches to `_write_batches()` once `batch_rows` rows are pending or
+    `flush_interval` seconds have passed since the last write. `flush()` forces pending rows to disk, `close()`
+    writes them, calls `_finish()` and stops the thread. If writing fails the thread stops, keeps the exception in
+    `error`, and later batches are ignored.
+    """
+
+    _FLUSH = object()
+    _CLOSE = object()
+
+    def __init__(self, path: str, batch_rows: int, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.error = None
+        self._queue = queue.SimpleQueue()
+        self._flushed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def write(self, times, values, sensor_time: float = math.nan):
+        """ Queue a batch of samples; `sensor_time` is the sensor timestamp of its last sample. Never blocks. """
+        if self.error is not None or len(times) == 0:
+            return
+        self._queue.put((sensor_time, np.asarray(times), np.asarray(values)))
+
+    def flush(self, timeout: float = None) -> bool:
+        """ Write everything queued so far to disk. Returns False on timeout, or if the writer thread has stopped on
+        an error (kept in `error`). """
+        # Cleared first: a thread ending after the check below still sets it on its way out
+        self._flushed.clear()
+        if not self._thread.is_alive():
+            return False
+        self._queue.put(self._FLUSH)
+        return self._flushed.wait(timeout) and self.error is None
+
+    def close(self, timeout: float = None):
+        """ Write what is pending, finish the output and stop the writer thread. """
+        if self._thread.is_alive():
+            self._queue.put(self._CLOSE)
+            self._thread.join(timeout)
+
+    def _output(self):
+        """ Context manager holding the output open, entered on the writer thread. """
+        raise NotImplementedError
+
+    def _write_batches(self, pending):
+        """ Write a list of (sensor_time, times, values) batches. """
+        raise NotImplementedError
+
+    def _finish(self):
+        """ Complete the output before it is closed. """
+
+    def _run(self):
+        pending = []
+        pending_rows = 0
+        last_write = time.monotonic()
+
+        def write_pending():
+            nonlocal pending, pending_rows, last_write
+            if pending:
+                self._write_batches(pending)
+                self.rows_written += pending_rows
+            pending = []
+            pending_rows = 0
+            last_write = time.monotonic()
+
+        try:
+            with self._output():
+                while True:
+                    timeout = max(0.0, self.flush_interval - (time.monotonic() - last_write)) if pending else None
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        write_pending()
+                        continue
+                    if item is self._CLOSE:
+                        write_pending()
+                        self._finish()
+                        return
+                    if item is self._FLUSH:
+                        write_pending()
+                        self._flushed.set()
+                        continue
+                    pending.append(item)
+                    pending_rows += len(item[1])
+                    if pending_rows >= self.batch_rows:
+                        write_pending()
+        except Exception as ex:
+            self.error = ex
+            print("Recording stopped, cannot write {0}: {1}".format(self.path, ex))
+        finally:
+            self._flushed.set()
@@ -0,0 +1,267 @@
+import argparse
+import csv
+import math
+import mmap
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from .BackgroundWriter import BackgroundWriter
+
+# Chunked, append-only recording of one PMD stream (int32 samples) with its frame timestamps.
+#
+#   file    = FILE_HEADER chunk* [index FOOTER]
+#   chunk   = CHUNK_HEADER frame records (FRAME_DTYPE) int32 samples (n_samples * channels, little-endian)
+#   index   = one INDEX_DTYPE record per chunk, followed by FOOTER which locates and checksums it
+#
+# Every chunk carries a CRC-32 of its header fields and payload, so a recording cut short by a crash is read up to
+# its last complete chunk; the index is only written by `close()` and is an accelerator, never required. Frames keep
+# the sensor timestamp of their last sample and the host times of their first and last samples, from which the host
+# time of every sample is interpolated (the sensor-to-host clock model is linear within a frame).
+
+MAGIC = b"H10REC\x00\x00"
+VERSION = 1
+FILE_HEADER = struct.Struct("<8sHHdd")  # magic, version, channels, sampling frequency (Hz), creation time
+CHUNK_MAGIC = b"CHNK"
+CHUNK_HEADER = struct.Struct("<4sIIII")  # magic, sequence, frames, samples, CRC-32
+INDEX_MAGIC = b"INDX"
+FOOTER = struct.Struct("<4sQII")  # magic, index offset, chunks, CRC-32 of the index
+FRAME_DTYPE = np.dtype([("sensor_time", "<f8"), ("host_first", "<f8"), ("host_last", "<f8"), ("samples", "<u4")])
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("first_sample", "<u8"), ("samples", "<u4"), ("frames", "<u4"),
+                        ("host_first", "<f8"), ("host_last", "<f8")])
+
+
+def _chunk_crc(sequence: int, n_frames: int, n_samples: int, payload) -> int:
+    return zlib.crc32(payload, zlib.crc32(struct.pack("<III", sequence, n_frames, n_samples)))
+
+
+class BinaryRecording:
+    """ Read-only, memory-mapped view of a recording written by `BinaryRecordingWriter`.
+
+    `read()` returns the whole recording, `window(t0, t1)` only the chunks overlapping a host-time range, and `chunks()`
+    iterates chunk by chunk with constant memory. `truncated` is True when trailing bytes were not a valid chunk (the
+    writer was interrupted); everything before them is still available.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < FILE_HEADER.size:
+            self._file.close()
+            raise ValueError("Not an H10 recording: {0}".format(path))
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.channels, self.sampling_frequency, self.created = FILE_HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("Not an H10 recording (or unsupported version): {0}".format(path))
+        self.truncated = False
+        self.index = self._read_index(size)
+        if self.index is None:
+            self.index, self.end_offset = self._scan(size)
+        else:
+            self.end_offset = size - FOOTER.size - self.index.nbytes
+
+    def _read_index(self, size: int):
+        if size < FILE_HEADER.size + FOOTER.size:
+            return None
+        magic, offset, n_chunks, crc = FOOTER.unpack_from(self._mmap, size - FOOTER.size)
+        if magic != INDEX_MAGIC or offset + n_chunks * INDEX_DTYPE.itemsize + FOOTER.size != size:
+            return None
+        index = np.frombuffer(self._mmap, INDEX_DTYPE, count=n_chunks, offset=offset)
+        if zlib.crc32(index) != crc:
+            return None
+        return index
+
+    def _scan(self, size: int):
+        """ Rebuild the index by walking the chunks; stops at the first incomplete or corrupt one. """
+        entries = []
+        offset = FILE_HEADER.size
+        first_sample = 0
+        while offset + CHUNK_HEADER.size <= size:
+            magic, sequence, n_frames, n_samples, crc = CHUNK_HEADER.unpack_from(self._mmap, offset)
+            payload_size = n_frames * FRAME_DTYPE.itemsize + n_samples * self.channels * 4
+            end = offset + CHUNK_HEADER.size + payload_size
+            if magic != CHUNK_MAGIC or end > size:
+                break
+            payload = memoryview(self._mmap)[offset + CHUNK_HEADER.size:end]
+            valid = _chunk_crc(sequence, n_frames, n_samples, payload) == crc
+            payload.release()
+            if not valid:
+                break
+            frames = np.frombuffer(self._mmap, FRAME_DTYPE, count=n_frames, offset=offset + CHUNK_HEADER.size)
+            entries.append((offset, first_sample, n_samples, n_frames,
+                            frames["host_first"][0] if n_frames else math.nan,
+                            frames["host_last"][-1] if n_frames else math.nan))
+            first_sample += n_samples
+            offset = end
+        # Trailing bytes that are neither a chunk nor an index mean the writer did not finish.
+        if offset < size and not self._is_index_at(offset, size):
+            self.truncated = True
+        return np.array(entries, dtype=INDEX_DTYPE), offset
+
+    def _is_index_at(self, offset: int, size: int) -> bool:
+        if size - FOOTER.size < offset:
+            return False
+        magic, index_offset, _, _ = FOOTER.unpack_from(self._mmap, size - FOOTER.size)
+        return magic == INDEX_MAGIC and index_offset == offset
+
+    def __len__(self):
+        return int(self.index["samples"].sum())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # The index may be a view of the mapping, which must be released before the mapping can be closed.
+        if getattr(self, "index", None) is not None:
+            self.index = self.index.copy()
+        self._mmap.close()
+        self._file.close()
+
+    def _chunk(self, entry):
+        """ (frames, values) views of one chunk, without copying. """
+        offset = int(entry["offset"]) + CHUNK_HEADER.size
+        n_frames = int(entry["frames"])
+        frames = np.frombuffer(self._mmap, FRAME_DTYPE, count=n_frames, offset=offset)
+        values = np.frombuffer(self._mmap, "<i4", count=int(entry["samples"]) * self.channels,
+                               offset=offset + n_frames * FRAME_DTYPE.itemsize)
+        if self.channels > 1:
+            values = values.reshape(-1, self.channels)
+        return frames, values
+
+    @staticmethod
+    def sample_times(frames) -> np.ndarray:
+        """ Host time of every sample, interpolated between the first and last sample of each frame. """
+        n = frames["samples"].astype(np.int64)
+        step = (frames["host_last"] - frames["host_first"]) / np.maximum(n - 1, 1)
+        if len(n) and (n == n[0]).all():
+            # Usual case, every frame the same length: a (frames, samples) grid.
+            return (frames["host_first"][:, None] + np.arange(n[0]) * step[:, None]).ravel()
+        k = np.arange(int(n.sum())) - np.repeat(np.cumsum(n) - n, n)
+        return np.repeat(frames["host_first"], n) + k * np.repeat(step, n)
+
+    def chunks(self, start: int = 0, stop: int = None):
+        """ Yield (times, values) chunk by chunk. """
+        for entry in self.index[start:stop]:
+            frames, values = self._chunk(entry)
+            yield self.sample_times(frames), values.astype(np.int32)
+
+    @property
+    def frames(self) -> np.ndarray:
+        """ Every frame record (sensor_time, host_first, host_last, samples), in order. """
+        if len(self.index) == 0:
+            return np.empty(0, dtype=FRAME_DTYPE)
+        return np.concatenate([self._chunk(entry)[0] for entry in self.index])
+
+    def read(self, start: int = 0, stop: int = None):
+        """ (times, values) of chunks `start` to `stop` (all by default). """
+        parts = [self._chunk(entry) for entry in self.index[start:stop]]
+        if not parts:
+            return np.empty(0), np.empty((0,) if self.channels == 1 else (0, self.channels), dtype=np.int32)
+        frames = np.concatenate([frames for frames, _ in parts])
+        values = np.concatenate([values for _, values in parts]).astype(np.int32, copy=False)
+        return self.sample_times(frames), values
+
+    def window(self, t0: float, t1: float):
+        """ (times, values) with t0 <= time <= t1; only the chunks overlapping the range are decoded. """
+        start = int(np.searchsorted(self.index["host_last"], t0, side="left"))
+        stop = int(np.searchsorted(self.index["host_first"], t1, side="right"))
+        times, values = self.read(start, max(start, stop))
+        lo = np.searchsorted(times, t0, side="left")
+        hi = np.searchsorted(times, t1, side="right")
+        return times[lo:hi], values[lo:hi]
+
+    def to_csv(self, csv_path: str):
+        """ Write `timestamp,value` rows (`timestamp,v1,v2,...` for several channels), like `BufferedCsvWriter`. """
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            for times, values in self.chunks():
+                if values.ndim == 1:
+                    writer.writerows(zip(times.tolist(), values.tolist()))
+                else:
+                    writer.writerows(zip(times.tolist(), *values.T.tolist()))
+
+
+class BinaryRecordingWriter(BackgroundWriter):
+    """ Append frames to a chunked binary recording from a background thread (drop-in for `BufferedCsvWriter`).
+
+    The writer thread gathers the pending frames into one checksummed chunk once `chunk_samples` samples are pending
+    or `flush_interval` seconds have passed (see `BackgroundWriter`), so a crash loses at most that much. `close()`
+    writes the last chunk and the index. Opening an existing recording continues it: a torn last chunk or an old
+    index is cut off first.
+    """
+
+    def __init__(self, path: str, sampling_frequency: float = 130.0, channels: int = 1, chunk_samples: int = 8192,
+                 flush_interval: float = 1.0):
+        self.path = path
+        self.sampling_frequency = sampling_frequency
+        self.channels = channels
+        self.chunk_samples = chunk_samples
+        self._index = []
+        rows_written, self._file = self._open()
+        super().__init__(path, chunk_samples, flush_interval)
+        self.rows_written = rows_written
+
+    def _open(self):
+        """ (samples already recorded, file positioned to append the next chunk). """
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with BinaryRecording(self.path) as existing:
+                if existing.channels != self.channels:
+                    raise ValueError("{0} has {1} channel(s), not {2}".format(self.path, existing.channels,
+                                                                              self.channels))
+                self._index = existing.index.tolist()
+                end_offset = existing.end_offset
+            f = open(self.path, "r+b")
+            f.truncate(end_offset)
+            f.seek(end_offset)
+            return sum(entry[2] for entry in self._index), f
+        f = open(self.path, "wb")
+        f.write(FILE_HEADER.pack(MAGIC, VERSION, self.channels, self.sampling_frequency, time.time()))
+        f.flush()
+        return 0, f
+
+    def _output(self):
+        return self._file
+
+    def _write_batches(self, pending):
+        frames = np.empty(len(pending), dtype=FRAME_DTYPE)
+        for i, (sensor_time, times, values) in enumerate(pending):
+            frames[i] = (sensor_time, times[0], times[-1], len(times))
+        values = np.concatenate([values for _, _, values in pending]).astype("<i4")
+        payload = frames.tobytes() + values.tobytes()
+        n_samples = int(frames["samples"].sum())
+        sequence = len(self._index)
+        offset = self._file.tell()
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, sequence, len(frames), n_samples,
+                                           _chunk_crc(sequence, len(frames), n_samples, payload)))
+        self._file.write(payload)
+        self._file.flush()
+        self._index.append((offset, self.rows_written, n_samples, len(frames),
+                            frames["host_first"][0], frames["host_last"][-1]))
+
+    def _finish(self):
+        """ Write the index and the footer locating it. """
+        index = np.array(self._index, dtype=INDEX_DTYPE)
+        offset = self._file.tell()
+        self._file.write(index.tobytes())
+        self._file.write(FOOTER.pack(INDEX_MAGIC, offset, len(index), zlib.crc32(index)))
+        self._file.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert an H10 binary recording to the `timestamp,value` CSV layout.")
+    parser.add_argument("recording")
+    parser.add_argument("output", nargs="?", help="CSV file (default: the recording with a .csv extension)")
+    args = parser.parse_args()
+    with BinaryRecording(args.recording) as recording:
+        if recording.truncated:
+            print("{0} was not closed properly; converting its {1} complete chunk(s)".format(
+                args.recording, len(recording.index)))
+        recording.to_csv(args.output or os.path.splitext(args.recording)[0] + ".csv")
@@ -0,0 +1,87 @@
+import numpy as np
+
+
+class ClockSync:
+    """ Online sensor-to-host clock model: host_time = sensor_time + offset + drift * (sensor_time - origin).
+
+    Each PMD frame gives one (sensor timestamp, host arrival time) pair. The model is an exponentially weighted
+    linear regression of the difference between the two clocks against sensor time, kept as running sums so every
+    update is O(1). Arrivals delayed far beyond the usual transport latency (retransmissions, bursts after a stall)
+    are clipped to the upper edge of the expected band so they cannot drag the estimate late.
+
+    The offset therefore includes the typical BLE transport latency, which is also what host-stamped streams (HR,
+    IBI, GUI events) carry, so all streams end up in the same host timebase.
+    """
+
+    def __init__(self, half_life: float = 500.0, outlier_sigma: float = 3.0, warmup: int = 20):
+        # `half_life` is in packets: the weight of an observation halves after that many newer ones.
+        self._decay = 0.5 ** (1.0 / half_life)
+        self._outlier_sigma = outlier_sigma
+        self._warmup = warmup
+        self.reset()
+
+    def reset(self):
+        """ Forget the model, e.g. after the sensor clock restarted. """
+        self._origin = None  # first sensor time, keeps regression inputs small
+        self._base = 0.0  # first observed clock difference
+        self._sw = self._sx = self._sy = self._sxx = self._sxy = 0.0
+        self._variance = 0.0
+        self._intercept = 0.0
+        self._slope = 0.0
+        self.updates = 0
+
+    @property
+    def offset(self) -> float:
+        """ host_time - sensor_time at the most recent fit origin (s). """
+        return self._base + self._intercept
+
+    @property
+    def drift(self) -> float:
+        """ Host seconds gained per sensor second (e.g. 20e-6 = 20 ppm). """
+        return self._slope
+
+    @property
+    def is_synced(self) -> bool:
+        return self.updates > 0
+
+    def update(self, sensor_time: float, host_time: float):
+        """ Feed one (sensor timestamp, host arrival time) pair. """
+        if self._origin is None:
+            self._origin = sensor_time
+            self._base = host_time - sensor_time
+        x = sensor_time - self._origin
+        y = host_time - sensor_time - self._base
+
+        if self.updates >= self._warmup:
+            residual = y - (self._intercept + self._slope * x)
+            limit = self._outlier_sigma * np.sqrt(self._variance)
+            if residual > limit:
+                y -= residual - limit
+            self._variance = self._decay * self._variance + (1.0 - self._decay) * min(residual, limit) ** 2
+        elif self.updates > 0:
+            residual = y - (self._intercept + self._slope * x)
+            self._variance += (residual ** 2 - self._variance) / (self.updates + 1)
+
+        d = self._decay
+        self._sw = d * self._sw + 1.0
+        self._sx = d * self._sx + x
+        self._sy = d * self._sy + y
+        self._sxx = d * self._sxx + x * x
+        self._sxy = d * self._sxy + x * y
+        self.updates += 1
+
+        denominator = self._sw * self._sxx - self._sx * self._sx
+        # Until the observations span some time the drift is unobservable; fit the offset only.
+        if self.updates < 3 or denominator <= 1e-9 * self._sw * self._sw:
+            self._slope = 0.0
+            self._intercept = self._sy / self._sw
+        else:
+            self._slope = (self._sw * self._sxy - self._sx * self._sy) / denominator
+            self._intercept = (self._sy - self._slope * self._sx) / self._sw
+
+    def to_host(self, sensor_times):
+        """ Convert sensor timestamps (scalar or array, seconds) to host time. """
+        if self._origin is None:
+            return sensor_times
+        sensor_times = np.asarray(sensor_times, dtype=np.float64)
+        return sensor_times + self._base + self._intercept + self._slope * (sensor_times - self._origin)
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_digests(path: str, prefix_size: int):
+    """ SHA-256 (hex) of the first `prefix_size` bytes of a file and of the whole file, in one read. """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        remaining = prefix_size
+        while remaining > 0:
+            block = f.read(min(HASH_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+        prefix = digest.hexdigest()
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return prefix, digest.hexdigest()
+
+
+class ConversionCache:
+    """ What each conversion of an export produced, kept next to it in `<export>_conversions.json`.
+
+    An entry records the size, mtime and SHA-256 of the export when it was converted, the converter version, the
+    outputs with their sizes, and the converter's state for continuing the conversion. `check()` compares that with
+    the export and outputs on disk: "fresh" when the outputs are still what the export would give (same size and
+    mtime, or same content), "appended" when rows were only added at the end of the export since (its first `size`
+    bytes hash the same), "stale" otherwise.
+    """
+
+    def __init__(self, source_path: str):
+        self.source_path = source_path
+        self.path = os.path.splitext(source_path)[0] + "_conversions.json"
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def entry(self, name: str):
+        return self.entries.get(name)
+
+    def check(self, name: str, version: int) -> str:
+        entry = self.entries.get(name)
+        if entry is None or entry["version"] != version:
+            return "stale"
+        if not all(os.path.exists(path) and os.path.getsize(path) == size for path, size in entry["outputs"]):
+            return "stale"
+        stat = os.stat(self.source_path)
+        if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+            return "fresh"
+        if stat.st_size < entry["size"]:
+            return "stale"
+        prefix, _ = file_digests(self.source_path, entry["size"])
+        if prefix != entry["sha256"]:
+            return "stale"
+        if stat.st_size == entry["size"]:
+            # Only touched: remember the new mtime so the next check does not hash again
+            entry["mtime_ns"] = stat.st_mtime_ns
+            self._save()
+            return "fresh"
+        return "appended"
+
+    def source_stat(self) -> dict:
+        """ Size, mtime and SHA-256 of the export now, and whether it ends with a complete row. """
+        stat = os.stat(self.source_path)
+        _, sha256 = file_digests(self.source_path, 0)
+        with open(self.source_path, "rb") as f:
+            f.seek(max(stat.st_size - 1, 0))
+            complete = f.read(1) == b"\n"
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256, "complete": complete}
+
+    def store(self, name: str, version: int, source: dict, outputs, state=None):
+        """ Record a conversion of the export as it was when `source` (from `source_stat()`) was taken. """
+        self.entries[name] = dict(source, version=version, state=state,
+                                  outputs=[[path, os.path.getsize(path)] for path in outputs])
+        self._save()
+
+    def forget(self, name: str):
+        if self.entries.pop(name, None) is not None:
+            self._save()
+
+    def _save(self):
+        partial_path = self.path + ".part"
+        with open(partial_path, "w") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(partial_path, self.path)
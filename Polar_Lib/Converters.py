@@ -0,0 +1,472 @@
+import contextlib
+import itertools
+import os
+import re
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from .ConversionCache import ConversionCache
+from .ExportIngest import CHUNK_ROWS, ExportFile
+
+ECG_SAMPLING_FREQUENCY = 130.0
+EEG_SAMPLING_FREQUENCY = 1024.0
+KEPLR_PROCESSED_COLUMNS = ['Bio_Time', 'Bio_Focus', 'Bio_Agitation', 'Bio_Delta', 'Bio_Theta', 'Bio_Beta',
+                           'Bio_Alpha', 'Bio_Gamma']
+
+
+class MissingColumnsError(ValueError):
+    """ The export does not have the columns a conversion starts from (it holds another sensor's data). """
+
+
+class _OutOfOrder(Exception):
+    """ A batch of samples reaches back before samples already written, or appended rows do not follow the rows an
+    output was converted from. """
+
+
+@contextlib.contextmanager
+def _partial_output(path: str):
+    """ Open `path` for writing under another name, renamed once complete, so a failed conversion never leaves a
+    truncated output behind. """
+    partial_path = path + ".part"
+    try:
+        with open(partial_path, "w", newline="") as f:
+            yield f
+    except BaseException:
+        os.remove(partial_path)
+        raise
+    os.replace(partial_path, path)
+
+
+def _unique_sorted(times, values):
+    """ Samples sorted by time (then value), each distinct (time, value) pair once. """
+    # Export samples come nearly in order, which a stable sort handles in about linear time
+    order = np.argsort(times, kind="stable")
+    times, values = times[order], values[order]
+    # Samples sharing a time (repeated rows) are ordered by value too, so that duplicates end up side by side
+    same = times[1:] == times[:-1]
+    tied = np.flatnonzero(np.concatenate(([False], same)) | np.concatenate((same, [False])))
+    values[tied] = values[tied[np.lexsort((values[tied], times[tied]))]]
+    keep = np.ones(len(times), dtype=bool)
+    keep[1:] = (times[1:] != times[:-1]) | (values[1:] != values[:-1])
+    return times[keep], values[keep]
+
+
+def _first_seen(hashes, seen: set):
+    """ Mask of the 64-bit row hashes neither in `seen` nor earlier in `hashes`; adds them all to `seen`. A set keeps
+    each chunk O(chunk), where merging sorted arrays of every hash seen grew with the rows read so far. """
+    keep = np.empty(len(hashes), dtype=bool)
+    for i, h in enumerate(hashes.tolist()):
+        keep[i] = h not in seen
+        seen.add(h)
+    return keep
+
+
+def _write_samples(f, times, values):
+    """ `timestamp,value` rows, each number as its repr() like the f-strings of the row-by-row writer gave (about
+    twice as fast as DataFrame.to_csv, whose float formatting goes through numpy). """
+    if len(times):
+        f.write("\n".join(map(",".join, zip(map(repr, times.tolist()), map(repr, values.tolist())))) + "\n")
+
+
+class _SampleWriter:
+    """ Writes `timestamp,value` rows sorted by time, without duplicate samples, from batches of (times, values)
+    arrays given in file order.
+
+    While `streaming`, samples are written as soon as no later batch can precede them, so about one batch is held at a
+    time; a batch starting before samples already written raises `_OutOfOrder`. Otherwise every sample is held and
+    sorted at once by `close()`. `close()` returns a checkpoint, from which another writer given the same file (opened
+    "r+") carries on as if the batches had never stopped: the rows written by the final flush are read back as pending.
+    """
+
+    def __init__(self, f, streaming: bool = True, checkpoint: dict = None):
+        self.f = f
+        self.streaming = streaming
+        self.pending = []
+        self.written_upto = -np.inf
+        if checkpoint is None:
+            f.write("timestamp,value\n")
+            return
+        f.seek(checkpoint["offset"])
+        # float() of the repr of a float gives it back exactly
+        numbers = np.array(f.read().replace("\n", ",").split(",")[:-1], dtype="float64")
+        f.seek(checkpoint["offset"])
+        f.truncate()
+        self.pending.append((numbers[0::2], numbers[1::2]))
+        self.written_upto = checkpoint["time"]
+
+    def add(self, times, values):
+        if self.streaming and len(times):
+            start = times.min()
+            if start < self.written_upto:
+                raise _OutOfOrder()
+            if self.pending:
+                # Later batches start at or after this one: what precedes it is final
+                times_, values_ = (np.concatenate(arrays) for arrays in zip(*self.pending))
+                ready = times_ < start
+                _write_samples(self.f, *_unique_sorted(times_[ready], values_[ready]))
+                self.pending = [(times_[~ready], values_[~ready])]
+            self.written_upto = start
+        self.pending.append((times, values))
+
+    def close(self):
+        """ Write the pending samples. Returns the checkpoint to carry on from, None if not streaming. """
+        offset = self.f.tell()
+        if self.pending:
+            _write_samples(self.f, *_unique_sorted(*(np.concatenate(arrays) for arrays in zip(*self.pending))))
+            self.pending = []
+        return {"offset": offset, "time": float(self.written_upto)} if self.streaming else None
+
+
+class _KeyedRowWriter:
+    """ Writes rows sorted by a key (rows without a key last), keeping the first row of each key, from batches of
+    (keys, rows) given in file order, the way `_SampleWriter` writes samples.
+
+    Only a 64-bit hash of each key seen is kept across batches. `close()` returns a checkpoint holding the last key
+    written; another writer given the file (opened "r+") and the checkpoint carries on after it.
+    """
+
+    def __init__(self, f, columns, streaming: bool = True, checkpoint: dict = None):
+        self.f = f
+        self.streaming = streaming
+        self.pending = []
+        self.keyless = None  # The row without a key, written last
+        self.seen = set()
+        self.last = None
+        if checkpoint is None:
+            pd.DataFrame(columns=columns).to_csv(f, index=False)
+            return
+        f.seek(checkpoint["offset"])
+        self.keyless = f.read() or None
+        f.seek(checkpoint["offset"])
+        f.truncate()
+        self.last = checkpoint["last"]
+        if self.last is not None:
+            self.seen.update(pd.util.hash_pandas_object(pd.Series([self.last]), index=False).tolist())
+
+    def add(self, keys: pd.Series, rows: pd.DataFrame):
+        hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+        keep = _first_seen(hashes, self.seen)
+        keys, rows = keys[keep], rows[keep]
+        keyless = keys.isna().to_numpy()
+        if keyless.any():
+            if self.keyless is None:
+                self.keyless = rows[keyless].to_csv(header=False, index=False)
+            keys, rows = keys[~keyless], rows[~keyless]
+        if self.streaming and len(keys):
+            start = keys.min()
+            if self.last is not None and start < self.last:
+                # Keys already written were dropped above: this one is new and belongs before them
+                raise _OutOfOrder()
+            if self.pending:
+                keys_, rows_ = pd.concat([k for k, _ in self.pending]), pd.concat([r for _, r in self.pending])
+                ready = (keys_ < start).to_numpy()
+                self._write(keys_[ready], rows_[ready])
+                self.pending = [(keys_[~ready], rows_[~ready])]
+        self.pending.append((keys, rows))
+
+    def _write(self, keys, rows):
+        if len(keys):
+            rows.iloc[np.argsort(keys.to_numpy(), kind="stable")].to_csv(self.f, header=False, index=False)
+            self.last = keys.max()
+
+    def close(self):
+        """ Write the pending rows. Returns the checkpoint to carry on from, None if not streaming. """
+        if self.pending:
+            self._write(pd.concat([k for k, _ in self.pending]), pd.concat([r for _, r in self.pending]))
+            self.pending = []
+        offset = self.f.tell()
+        if self.keyless is not None:
+            self.f.write(self.keyless)
+        last = self.last.item() if isinstance(self.last, np.generic) else self.last
+        return {"offset": offset, "last": last} if self.streaming else None
+
+
+def _convert_streaming(convert, source: str):
+    """ `convert(streaming=True)`, or, if its samples come out of order, `convert(streaming=False)`. """
+    try:
+        return convert(True)
+    except _OutOfOrder:
+        print("{0}: samples are not in time order, sorting them in memory".format(source))
+        return convert(False)
+
+
+def convert_ecg(input_path: str, output_path: str = None, chunk_rows: int = CHUNK_ROWS) -> str:
+    """ Reshape the wide Bio_ECG* rows of an export into `timestamp,value` samples (`<input>_ecg.csv`).
+
+    Each row starts at its `Timestamp`; its k-th value is k sample periods later. Rows repeating an earlier row's ECG
+    values and rows without any ECG value are skipped. The export is read and written one chunk at a time; only a
+    64-bit hash per distinct row is kept across chunks to drop duplicates.
+    """
+    (output_path,), _ = _convert_ecg(input_path, output_path, chunk_rows)
+    return output_path
+
+
+def _convert_ecg(input_path, output_path=None, chunk_rows=CHUNK_ROWS, resume=None):
+    if resume is not None:
+        raise _OutOfOrder()  # Duplicate rows are dropped against the whole export: always converted in full
+    if output_path is None:
+        output_path = input_path.replace(".csv", "_ecg.csv")
+    export = ExportFile(input_path)
+    ecg_cols = export.select("bio_ecg", case_sensitive=False)
+    if 'Timestamp' not in export.columns or not ecg_cols:
+        raise MissingColumnsError("Required columns not found.")
+
+    # Offset of the k-th value of a row: k sample periods, rounded to the microsecond as timedelta() does
+    offsets = pd.to_timedelta([timedelta(seconds=i / ECG_SAMPLING_FREQUENCY) for i in range(len(ecg_cols))])
+    seen = set()
+    with _partial_output(output_path) as f:
+        pd.DataFrame(columns=["timestamp", "value"]).to_csv(f, index=False)
+        for chunk in export.chunks(numeric=ecg_cols, text=['Timestamp'], chunk_rows=chunk_rows):
+            timestamps = pd.to_datetime(chunk['Timestamp'])
+            # Duplicate rows, in this chunk or any earlier one; the first occurrence is kept
+            hashes = pd.util.hash_pandas_object(chunk[ecg_cols], index=False).to_numpy()
+            keep = _first_seen(hashes, seen)
+
+            values = chunk[ecg_cols].to_numpy()[keep]
+            present = ~np.isnan(values)  # NaNs are skipped; the following samples of the row move up to fill the gap
+            sample_index = np.cumsum(present, axis=1)[present] - 1
+            start_times = pd.DatetimeIndex(timestamps[keep]).repeat(present.sum(axis=1))
+            result = pd.DataFrame({"timestamp": start_times + offsets[sample_index], "value": values[present]})
+            result.to_csv(f, header=False, index=False)
+    return (output_path,), None
+
+
+def convert_polar(input_path: str, output_path: str = None, chunk_rows: int = CHUNK_ROWS) -> str:
+    """ Reshape the Bio_ECG_RAW* rows of an export into `timestamp,value` samples (`<input>_polar.csv`), sorted by
+    time and without duplicate samples. The k-th value of a row is k / 130 s after its `Bio_ECG_Timestamp`. """
+    (output_path,), _ = _convert_polar(input_path, output_path, chunk_rows)
+    return output_path
+
+
+def _convert_polar(input_path, output_path=None, chunk_rows=CHUNK_ROWS, resume=None):
+    """ `convert_polar()`, returning ((output_path,), state). With `resume` (the size the export had and the state
+    of its previous conversion), only the rows after that size are read and merged into the output. """
+    if output_path is None:
+        output_path = os.path.splitext(input_path)[0] + '_polar.csv'
+    export = ExportFile(input_path, start=resume[0] if resume else 0)
+    ecg_raw_cols = export.select('Bio_ECG_RAW')
+    if 'Bio_ECG_Timestamp' not in export.columns or not ecg_raw_cols:
+        raise MissingColumnsError("Required columns not found.")
+    offsets = np.arange(len(ecg_raw_cols)) * (1 / ECG_SAMPLING_FREQUENCY)
+
+    def write_samples(writer):
+        for chunk in export.chunks(numeric=['Bio_ECG_Timestamp'] + ecg_raw_cols, chunk_rows=chunk_rows):
+            values = chunk[ecg_raw_cols].to_numpy()
+            # One row of sample times per export row: its timestamp plus the offset of each column
+            times = chunk['Bio_ECG_Timestamp'].to_numpy()[:, None] + offsets
+            present = ~(np.isnan(values) | np.isnan(times))
+            writer.add(times[present], values[present])
+        return writer.close()
+
+    if resume:
+        with open(output_path, "r+", newline="") as f:
+            return (output_path,), write_samples(_SampleWriter(f, checkpoint=resume[1]))
+
+    def convert(streaming):
+        with _partial_output(output_path) as f:
+            return write_samples(_SampleWriter(f, streaming))
+
+    return (output_path,), _convert_streaming(convert, input_path)
+
+
+def parse_time_to_seconds(t):
+    """ Seconds in a Bio_Time value: hh:mm:ss(.ms), mm:ss(.ms) or ss(.ms); None if it cannot be parsed. """
+    if pd.isnull(t):
+        return None
+    if isinstance(t, (int, float)):
+        return float(t)
+    t = str(t).strip()
+    parts = re.split(r'[:]', t)
+    try:
+        parts = [float(p) for p in parts]
+    except Exception:
+        return None
+    if len(parts) == 3:
+        return parts[0]*3600 + parts[1]*60 + parts[2]
+    elif len(parts) == 2:
+        return parts[0]*60 + parts[1]
+    elif len(parts) == 1:
+        return parts[0]
+    return None
+
+
+def parse_times_to_seconds(times) -> np.ndarray:
+    """ `parse_time_to_seconds()` of a whole column of Bio_Time text at once: float64 seconds, NaN where a value cannot
+    be parsed.
+
+    The values are split at ':' by a single join and split of the column and every part is converted in one pass;
+    the parts are then combined according to their count, with the same arithmetic as `parse_time_to_seconds()`, so
+    the results are identical.
+    """
+    values = np.asarray(times, dtype=object)
+    seconds = np.full(len(values), np.nan)
+    present = ~pd.isna(values)
+    if not present.any():
+        return seconds
+    strings = list(map(str.strip, values[present]))
+    n_parts = np.fromiter(map(str.count, strings, itertools.repeat(":")), dtype=np.intp, count=len(strings)) + 1
+    flat = ":".join(strings).split(":")
+    try:
+        parts = np.fromiter(map(float, flat), dtype="float64", count=len(flat))
+    except ValueError:
+        parts = np.array([_to_float(part) for part in flat])
+    first = np.cumsum(n_parts) - n_parts
+    p0, p1, p2 = (parts[np.minimum(first + i, len(parts) - 1)] for i in range(3))
+    seconds[present] = np.select([n_parts == 3, n_parts == 2, n_parts == 1], [p0*3600 + p1*60 + p2, p0*60 + p1, p0],
+                                 np.nan)
+    return seconds
+
+
+def _to_float(text: str) -> float:
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def _bio_times(export: ExportFile, chunk_rows: int, text_only: bool = False):
+    """ First pass over the Bio_Time column of an export: (seconds of each row, numeric, first).
+
+    Like a full read_csv, Bio_Time is taken as numbers when every value is one (`numeric`, unless `text_only`), as
+    text otherwise; rows are ordered by it. `first` is the smallest value that gives a time (None if none does).
+    """
+    parsed, numbers = [], []
+    numeric = not text_only
+    first_text = None
+    for chunk in export.chunks(text=['Bio_Time'], chunk_rows=chunk_rows):
+        text = chunk['Bio_Time']
+        number = pd.to_numeric(text, errors="coerce")
+        numeric = numeric and number.notna().sum() == text.notna().sum()
+        seconds = parse_times_to_seconds(text)
+        if not np.isnan(seconds).all():
+            first = text[~np.isnan(seconds)].min()
+            first_text = first if first_text is None else min(first_text, first)
+        parsed.append(seconds)
+        numbers.append(number.to_numpy(dtype="float64"))
+    if not numeric:
+        return (np.concatenate(parsed) if parsed else np.empty(0)), False, first_text
+    seconds = np.concatenate(numbers) if numbers else np.empty(0)
+    return seconds, True, (float(np.nanmin(seconds)) if np.isfinite(seconds).any() else None)
+
+
+def convert_keplr(input_path: str, eeg_path: str = None, processed_path: str = None,
+                  chunk_rows: int = CHUNK_ROWS) -> tuple:
+    """ Extract the Bio_EEG_RAW* samples (`<input>_keplr.csv`) and the processed features
+    (`<input>_keplr_processed.csv`) of a Keplr export, with times in seconds since the first Bio_Time.
+
+    Both outputs are sorted by Bio_Time and written as the export is read chunk by chunk, after a first pass over the
+    Bio_Time column alone finds where times start.
+    """
+    return _convert_keplr(input_path, eeg_path, processed_path, chunk_rows)[0]
+
+
+def _convert_keplr(input_path, eeg_path=None, processed_path=None, chunk_rows=CHUNK_ROWS, resume=None):
+    """ `convert_keplr()`, returning ((eeg_path, processed_path), state); `resume` as for `_convert_polar()`. """
+    base = os.path.splitext(input_path)[0]
+    eeg_path = eeg_path or base + '_keplr.csv'
+    processed_path = processed_path or base + '_keplr_processed.csv'
+    state = resume[1] if resume else None
+    export = ExportFile(input_path, start=resume[0] if resume else 0)
+    eeg_raw_cols = export.select('Bio_EEG_RAW')
+    if 'Bio_Time' not in export.columns or not eeg_raw_cols:
+        raise MissingColumnsError("Required EEG columns not found.")
+    missing = export.missing(KEPLR_PROCESSED_COLUMNS)
+
+    seconds, numeric, first = _bio_times(export, chunk_rows, text_only=state is not None and not state["numeric"])
+    if state is not None:
+        # Times keep starting where they did, and the new rows follow the converted ones
+        if (state["numeric"] and not numeric) or (first is not None and first < state["first"]):
+            raise _OutOfOrder()
+        first, time_offset = state["first"], state["time_offset"]
+    elif first is None:
+        raise ValueError("Could not parse any Bio_Time values. Check the time format.")
+    else:
+        # Compute offset so time starts at zero
+        time_offset = first if numeric else parse_time_to_seconds(first)
+    eeg_offsets = np.arange(len(eeg_raw_cols)) / EEG_SAMPLING_FREQUENCY
+    feature_cols = [col for col in KEPLR_PROCESSED_COLUMNS[1:] if col not in missing]
+
+    def write_outputs(eeg, processed):
+        for chunk in export.chunks(numeric=eeg_raw_cols + feature_cols, text=['Bio_Time'], chunk_rows=chunk_rows):
+            times = seconds[chunk.index.to_numpy()] - time_offset
+            values = chunk[eeg_raw_cols].to_numpy()
+            # The i-th EEG value of a row is i sample periods after its Bio_Time
+            eeg_times = times[:, None] + eeg_offsets
+            present = ~(np.isnan(values) | np.isnan(eeg_times))
+            eeg.add(eeg_times[present], values[present])
+            if processed is not None:
+                keys = pd.to_numeric(chunk['Bio_Time']) if numeric else chunk['Bio_Time']
+                processed.add(keys, chunk[KEPLR_PROCESSED_COLUMNS].assign(Bio_Time=times))
+        checkpoints = eeg.close(), processed.close() if processed is not None else None
+        if None in checkpoints:
+            return None  # Not streamed, or without processed output: converted in full next time
+        return {"eeg": checkpoints[0], "processed": checkpoints[1], "numeric": numeric, "first": first,
+                "time_offset": time_offset}
+
+    if state is not None:
+        with open(eeg_path, "r+", newline="") as eeg_file, open(processed_path, "r+", newline="") as processed_file:
+            state = write_outputs(_SampleWriter(eeg_file, checkpoint=state["eeg"]),
+                                  _KeyedRowWriter(processed_file, KEPLR_PROCESSED_COLUMNS,
+                                                  checkpoint=state["processed"]))
+        return (eeg_path, processed_path), state
+
+    def convert(streaming):
+        with contextlib.ExitStack() as stack:
+            eeg = _SampleWriter(stack.enter_context(_partial_output(eeg_path)), streaming)
+            processed = None
+            if not missing:
+                processed = _KeyedRowWriter(stack.enter_context(_partial_output(processed_path)),
+                                            KEPLR_PROCESSED_COLUMNS, streaming)
+            return write_outputs(eeg, processed)
+
+    state = _convert_streaming(convert, input_path)
+    if missing:
+        raise ValueError(f"Missing processed columns: {', '.join(missing)}")
+    return (eeg_path, processed_path), state
+
+
+# Conversions by name, for batch use: each takes the export path and returns its output path(s).
+CONVERTERS = {"ecg": convert_ecg, "polar": convert_polar, "keplr": convert_keplr}
+
+# Bumped whenever a conversion changes what it writes, so that outputs cached by `convert_cached()` are redone.
+CONVERTER_VERSIONS = {"ecg": 1, "polar": 1, "keplr": 1}
+
+# How `convert_cached()` got the outputs, for status messages.
+CONVERT_STATUS = {"cached": "Up to date", "appended": "Appended new rows to", "converted": "Converted"}
+
+_CONVERSIONS = {"ecg": _convert_ecg, "polar": _convert_polar, "keplr": _convert_keplr}
+
+
+def convert_cached(name: str, input_path: str, force: bool = False) -> tuple:
+    """ Run a conversion of `CONVERTERS` with its default output paths, unless its outputs are already up to date.
+
+    The `ConversionCache` of the export tells: when neither the export nor the outputs changed since the last
+    conversion, nothing is read; when rows were only appended to the export (a recording still in progress), only
+    those are converted and merged into the outputs; otherwise, or with `force`, the export is converted again.
+    Returns (output paths, how), `how` being "cached", "appended" or "converted".
+    """
+    version = CONVERTER_VERSIONS[name]
+    cache = ConversionCache(input_path)
+    status = "stale" if force else cache.check(name, version)
+    entry = cache.entry(name)
+    if status == "fresh":
+        return tuple(path for path, _ in entry["outputs"]), "cached"
+    cache.forget(name)  # The outputs change from here on
+    source = cache.source_stat()
+    result = None
+    if status == "appended" and entry["complete"] and entry["state"] is not None:
+        try:
+            result = _CONVERSIONS[name](input_path, resume=(entry["size"], entry["state"])), "appended"
+        except _OutOfOrder:
+            print("{0}: the appended rows do not follow the converted ones, converting it again".format(input_path))
+    if result is None:
+        result = _CONVERSIONS[name](input_path), "converted"
+    (outputs, state), how = result
+    stat = os.stat(input_path)
+    if (stat.st_size, stat.st_mtime_ns) == (source["size"], source["mtime_ns"]):
+        cache.store(name, version, source, outputs, state)
+    else:
+        print("{0}: changed while being converted, the outputs are not cached".format(input_path))
+    return outputs, how
@@ -0,0 +1,117 @@
+import math
+
+import numpy as np
+
+
+def minmax_envelope(times, values, n_bins: int):
+    """ Decimate a trace to at most 2 * `n_bins` points that draw the same as the full trace.
+
+    The samples are split into `n_bins` runs of equal length (one per pixel column when `n_bins` is the axes width in
+    pixels) and each run is replaced by its minimum and maximum, in the order they occur, so peaks such as R waves are
+    never lost. Traces already short enough are returned unchanged. Cost is O(len(values)) in NumPy.
+    """
+    times = np.asarray(times)
+    values = np.asarray(values)
+    n_bins = max(1, int(n_bins))
+    if len(values) <= 2 * n_bins:
+        return times, values
+    # Rounded up, so the runs (the last one possibly shorter) are at most `n_bins`
+    return _minmax_blocks(times, values, math.ceil(len(values) / n_bins))
+
+
+def _arg_minmax(blocks):
+    """ Index of the min and of the max of each row, ignoring NaNs; a row of NaNs gives its first sample for both, so
+    the gap it draws is kept. """
+    missing = np.isnan(blocks)
+    if not missing.any():
+        return np.argmin(blocks, axis=1), np.argmax(blocks, axis=1)
+    return np.argmin(np.where(missing, np.inf, blocks), axis=1), np.argmax(np.where(missing, -np.inf, blocks), axis=1)
+
+
+def _minmax_blocks(times, values, per_bin: int):
+    """ Min and max of each run of `per_bin` samples (and of the shorter last run), interleaved in time order. NaNs
+    are skipped unless a run holds nothing else. """
+    n_bins = len(values) // per_bin
+    used = n_bins * per_bin
+    blocks = values[:used].reshape(n_bins, per_bin)
+    first = np.arange(n_bins) * per_bin
+    i_min, i_max = _arg_minmax(blocks)
+    i_min += first
+    i_max += first
+    # Interleave min and max of each bin in time order.
+    index = np.empty(2 * n_bins, dtype=np.intp)
+    index[0::2] = np.minimum(i_min, i_max)
+    index[1::2] = np.maximum(i_min, i_max)
+    if used < len(values):
+        # The leftover samples form one last, shorter bin.
+        tail_min, tail_max = _arg_minmax(values[used:].reshape(1, -1))
+        tail_index = used + np.array(sorted((int(tail_min[0]), int(tail_max[0]))))
+        index = np.concatenate([index, tail_index])
+    return times[index], values[index]
+
+
+class MinMaxPyramid:
+    """ Min/max envelopes of a long trace at every power of `factor` samples per bin, computed once.
+
+    Level 0 is the trace itself; each level above holds the min and max of every `factor` runs of the level below,
+    interleaved in time order like `minmax_envelope()`, so any level draws the same outline as the full trace once its
+    bins are narrower than a pixel. `view()` picks the level to draw a time window with. The
+    levels above the trace take about 2 / (`factor` - 1) of its memory. Times must be sorted.
+    """
+
+    def __init__(self, times, values, factor: int = 8, min_points: int = 4096):
+        self.levels = [(np.asarray(times), np.asarray(values))]
+        per_bin = factor
+        while len(self.levels[-1][1]) > max(min_points, 2 * per_bin):
+            self.levels.append(_minmax_blocks(*self.levels[-1], per_bin))
+            per_bin = 2 * factor  # A level above the trace has 2 points per bin
+
+    def __len__(self):
+        return len(self.levels[0][1])
+
+    @property
+    def limits(self):
+        """ (min, max) of the whole trace, from the coarsest level. """
+        values = self.levels[-1][1]
+        return (np.nanmin(values), np.nanmax(values)) if len(values) else (np.nan, np.nan)
+
+    def view(self, start: float, end: float, n_bins: int):
+        """ (times, values) to draw the window [start, end] over `n_bins` pixel columns: the coarsest level that still
+        has a bin per column there, reduced to `minmax_envelope(..., n_bins)`, plus the points just outside the window
+        so the line reaches the edges. """
+        for times, values in reversed(self.levels):
+            first = np.searchsorted(times, start, side="left")
+            last = np.searchsorted(times, end, side="right")
+            if last - first >= 2 * n_bins:
+                break
+        # Falls through to the trace itself when the window holds fewer samples than columns
+        first, last = max(first - 1, 0), last + 1
+        return minmax_envelope(times[first:last], values[first:last], n_bins)
+
+
+class AutoScale:
+    """ Y limits that follow the data without changing on every frame.
+
+    The limits are recomputed (with `margin` padding) only when the data leaves them, or when the padded data span
+    falls below `shrink` of theirs; `update()` returns None otherwise, so the caller can keep its cached background.
+    """
+
+    def __init__(self, margin: float = 0.1, shrink: float = 0.5):
+        self.margin = margin
+        self.shrink = shrink
+        self.limits = None
+
+    def update(self, low: float, high: float):
+        """ New (bottom, top) limits for data spanning [low, high], or None if the current ones still fit. """
+        if not (np.isfinite(low) and np.isfinite(high)):
+            return None
+        pad = self.margin * (high - low) or 1.0
+        if self.limits is not None:
+            bottom, top = self.limits
+            if bottom <= low and high <= top and (high - low + 2 * pad) >= self.shrink * (top - bottom):
+                return None
+        self.limits = (low - pad, high + pad)
+        return self.limits
+
+    def reset(self):
+        self.limits = None
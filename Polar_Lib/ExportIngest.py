@@ -0,0 +1,76 @@
+import pandas as pd
+
+# Rows per chunk: ~10k rows of 73 float columns is a few MB, whatever the size of the export.
+CHUNK_ROWS = 10000
+
+
+class ExportFile:
+    """ Semicolon-separated sensor export, read column-projected and chunk by chunk.
+
+    The header is read once when the file is opened; `chunks()` then parses only the requested columns, with
+    explicit dtypes, `chunk_rows` rows at a time, so memory depends on the chunk size and not on the export size.
+    Numeric columns are float64 (they hold NaN wherever a row has no sample of that sensor). With `start`, reading
+    begins at that byte offset, which must be the start of a row: this is how rows appended to an export since an
+    earlier conversion are read on their own.
+    """
+
+    def __init__(self, path: str, sep: str = ";", encoding: str = "utf-8", start: int = 0):
+        self.path = path
+        self.sep = sep
+        self.encoding = encoding
+        self.start = start
+        self.columns = list(pd.read_csv(path, sep=sep, encoding=encoding, nrows=0).columns)
+
+    def select(self, prefix: str, case_sensitive: bool = True) -> list:
+        """ Columns whose name starts with `prefix`, in file order. """
+        if case_sensitive:
+            return [col for col in self.columns if col.startswith(prefix)]
+        return [col for col in self.columns if col.lower().startswith(prefix.lower())]
+
+    def missing(self, columns) -> list:
+        return [col for col in columns if col not in self.columns]
+
+    def chunks(self, numeric=(), text=(), chunk_rows: int = CHUNK_ROWS):
+        """ Yield DataFrames of the `text` (str) and `numeric` (float64) columns, in file order.
+
+        Each chunk is indexed by row number (counted from `start`). If a numeric column holds something that is not
+        a number, the rest of the file is parsed as text and such values become NaN.
+        """
+        numeric = [col for col in numeric if col not in text]
+        columns = list(text) + numeric
+        dtype = {col: str for col in text}
+        rows = 0
+        try:
+            for chunk in self._read_chunks(columns, dict(dtype, **{col: "float64" for col in numeric}), chunk_rows):
+                rows += len(chunk)
+                yield chunk
+            return
+        except ValueError as e:
+            print("{0}: {1}; parsing the remaining rows as text, non-numeric values are ignored".format(self.path, e))
+        for chunk in self._read_chunks(columns, dict(dtype, **{col: str for col in numeric}), chunk_rows, rows):
+            chunk[numeric] = chunk[numeric].apply(pd.to_numeric, errors="coerce").astype("float64")
+            yield chunk
+
+    def _read_chunks(self, columns, dtype, chunk_rows, skip_rows=0):
+        if self.start:
+            with open(self.path, "rb") as f:
+                f.seek(self.start)
+                reader = pd.read_csv(f, sep=self.sep, encoding=self.encoding, header=None, names=self.columns,
+                                     usecols=columns, dtype=dtype, chunksize=chunk_rows, skiprows=skip_rows)
+                yield from self._columns(reader, columns, skip_rows)
+        else:
+            reader = pd.read_csv(self.path, sep=self.sep, encoding=self.encoding, usecols=columns, dtype=dtype,
+                                 chunksize=chunk_rows, skiprows=range(1, skip_rows + 1))
+            yield from self._columns(reader, columns, skip_rows)
+
+    @staticmethod
+    def _columns(reader, columns, skip_rows):
+        with reader:
+            for chunk in reader:
+                chunk.index += skip_rows
+                # usecols does not keep the requested order
+                yield chunk[columns]
+
+    def read(self, numeric=(), text=()) -> pd.DataFrame:
+        """ The requested columns of the whole file, parsed chunk by chunk. """
+        return pd.concat(list(self.chunks(numeric, text)))
@@ -0,0 +1,273 @@
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+import time
+from typing import NamedTuple
+
+import numpy as np
+from bleak import BleakClient
+
+from .PolarLib import DeviceH10
+
+
+class Packet(NamedTuple):
+    """ One GATT notification: when it arrived (s from the start of the recording), from where, and its payload. """
+    time: float
+    uuid: str
+    data: bytes
+
+
+def _packet_line(packet: Packet) -> str:
+    return json.dumps({"t": packet.time, "uuid": packet.uuid, "data": bytes(packet.data).hex()}) + "\n"
+
+
+def save_packets(path: str, packets):
+    """ Write packets as JSON lines: {"t": seconds, "uuid": characteristic, "data": hex payload}. """
+    with open(path, "w") as f:
+        for packet in packets:
+            f.write(_packet_line(packet))
+
+
+def load_packets(path: str) -> list:
+    """ Read packets written by `save_packets`. """
+    packets = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                packets.append(Packet(float(record["t"]), record["uuid"], bytes.fromhex(record["data"])))
+    packets.sort(key=lambda p: p.time)
+    return packets
+
+
+class PacketLog:
+    """ Appends the notifications of one strap to a file as `save_packets` writes them, for replay with
+    `FakeBleakClient`. Times count from the first notification and keep running across reconnections. """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.packets = 0
+        self._start = None
+        self._file = open(path, "w")
+
+    def record(self, uuid: str, data):
+        now = time.perf_counter()
+        if self._start is None:
+            self._start = now
+        self._file.write(_packet_line(Packet(now - self._start, uuid, data)))
+        self.packets += 1
+
+    def close(self):
+        self._file.close()
+
+
+class LoggingBleakClient:
+    """ Wraps a BleakClient-compatible client so that every notification is recorded in a `PacketLog` before it
+    reaches the device's handler; everything else is passed through to the client. """
+
+    def __init__(self, client, log: PacketLog):
+        self._client = client
+        self._log = log
+
+    @classmethod
+    def factory(cls, logs: dict, client_factory=None):
+        """ Client factory for `DeviceH10(client_factory=...)` / `H10Session`, logging each strap to `logs[address]`
+        (a `PacketLog`). `client_factory` defaults to `bleak.BleakClient`. """
+        def create(address, **kwargs):
+            return cls((client_factory or BleakClient)(address, **kwargs), logs[address])
+        return create
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        uuid = str(char_specifier)
+
+        def logged(sender, data):
+            self._log.record(uuid, data)
+            return callback(sender, data)
+        await self._client.start_notify(char_specifier, logged, **kwargs)
+
+
+def synthetic_ecg(times: np.ndarray, heart_rate: float = 60.0) -> np.ndarray:
+    """ Crude ECG-like waveform (in uV): a narrow R wave and a broad T wave once per beat. """
+    phase = np.mod(times * heart_rate / 60.0, 1.0) * 60.0 / heart_rate  # seconds since the last beat
+    r_wave = 1000.0 * np.exp(-0.5 * ((phase - 0.05) / 0.012) ** 2)
+    t_wave = 250.0 * np.exp(-0.5 * ((phase - 0.30) / 0.05) ** 2)
+    return (r_wave + t_wave - 100.0).astype(np.int32)
+
+
+def synthetic_packets(duration: float, heart_rate: float = 60.0, acc_sampling_frequency: int = None,
+                      sensor_start: float = 600.0) -> list:
+    """ Build the notifications an H10 would send over `duration` seconds.
+
+    ECG frames hold 73 uncompressed samples at 130 Hz, ACC frames (if enabled) 36 16-bit xyz samples, and a
+    Heart Rate Measurement notification with the IBIs of the beats of the last second is sent every second.
+    PMD timestamps count nanoseconds from `sensor_start` seconds.
+    """
+    packets = []
+
+    ecg_per_frame = 73
+    fs = DeviceH10.ECG_SAMPLING_FREQUENCY
+    n_frames = int(duration * fs) // ecg_per_frame
+    sample_times = np.arange(n_frames * ecg_per_frame) / fs
+    values = synthetic_ecg(sample_times, heart_rate)
+    # 24-bit little-endian: low three bytes of each int32.
+    payload = values.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].reshape(n_frames, -1)
+    for k in range(n_frames):
+        last = sample_times[(k + 1) * ecg_per_frame - 1]
+        header = bytes([DeviceH10.PMD_ECG]) + int((sensor_start + last) * 1e9).to_bytes(8, "little") + bytes([0x00])
+        packets.append(Packet(float(last), DeviceH10.PMD_DATA_UUID, header + payload[k].tobytes()))
+
+    if acc_sampling_frequency is not None:
+        acc_per_frame = 36
+        n_frames = int(duration * acc_sampling_frequency) // acc_per_frame
+        acc_times = np.arange(n_frames * acc_per_frame) / acc_sampling_frequency
+        acc = np.stack((50 * np.sin(2 * np.pi * 0.3 * acc_times),
+                        30 * np.cos(2 * np.pi * 0.2 * acc_times),
+                        1000 + 20 * np.sin(2 * np.pi * heart_rate / 60.0 * acc_times)), axis=1).astype("<i2")
+        acc = acc.reshape(n_frames, -1)
+        for k in range(n_frames):
+            last = acc_times[(k + 1) * acc_per_frame - 1]
+            header = (bytes([DeviceH10.PMD_ACC]) + int((sensor_start + last) * 1e9).to_bytes(8, "little")
+                      + bytes([0x01]))
+            packets.append(Packet(float(last), DeviceH10.PMD_DATA_UUID, header + acc[k].tobytes()))
+
+    beat_period = 60.0 / heart_rate
+    ibi = int(round(beat_period * 1024))
+    beats = np.arange(beat_period, duration, beat_period)
+    for second in range(1, int(duration) + 1):
+        n_beats = int(np.count_nonzero((beats > second - 1) & (beats <= second)))
+        data = bytes([0x10, int(round(heart_rate))]) + ibi.to_bytes(2, "little") * n_beats
+        packets.append(Packet(float(second), DeviceH10.HEART_RATE_MEASUREMENT_UUID, data))
+
+    packets.sort(key=lambda p: p.time)
+    return packets
+
+
+class FakeBleakClient:
+    """ Stand-in for `bleak.BleakClient` that replays notifications instead of talking to a strap.
+
+    Only the subset of the BleakClient API used by `DeviceH10` is provided. Pass a factory to the device, e.g.
+
+        factory = functools.partial(FakeBleakClient, packets=synthetic_packets(60), speed=10)
+        await device.connect_async(client_factory=factory)
+
+    `speed` is the replay rate relative to real time (1 = real time, 10, 100, ...); `None` replays as fast as the
+    event loop can take it. When the packets run out the client calls `finished_callback(client)`, if given, then
+    reports a disconnection, as a strap walking out of range would.
+    """
+
+    MODEL_NUMBER = b"Polar H10"
+    MANUFACTURER_NAME = b"Polar Electro Oy"
+
+    def __init__(self, address, disconnected_callback=None, packets=(), speed: float = 1.0, battery_level: int = 100,
+                 finished_callback=None, **kwargs):
+        self.address = address
+        self._disconnected_callback = disconnected_callback
+        self._finished_callback = finished_callback
+        self._packets = list(packets)
+        self._speed = speed
+        self._battery_level = battery_level
+        self._callbacks = {}
+        self._pending = set()
+        self._player = None
+        self.is_connected = False
+        self.written = []
+        self.packets_sent = 0
+
+    @classmethod
+    def factory(cls, packets, speed: float = 1.0, **kwargs):
+        """ Client factory for `DeviceH10(client_factory=...)` / `connect_async(client_factory=...)`. """
+        return functools.partial(cls, packets=packets, speed=speed, **kwargs)
+
+    async def connect(self, **kwargs):
+        self.is_connected = True
+        return True
+
+    async def disconnect(self):
+        if self._player is not None:
+            self._player.cancel()
+            self._player = None
+        self.is_connected = False
+        return True
+
+    async def read_gatt_char(self, char_specifier, **kwargs) -> bytearray:
+        if char_specifier == DeviceH10.MODEL_NBR_UUID:
+            return bytearray(self.MODEL_NUMBER)
+        if char_specifier == DeviceH10.MANUFACTURER_NAME_UUID:
+            return bytearray(self.MANUFACTURER_NAME)
+        if char_specifier == DeviceH10.BATTERY_LEVEL_UUID:
+            return bytearray([self._battery_level])
+        # PMD control point: feature read response advertising ECG and ACC.
+        return bytearray([0x0F, 0x05, 0x00])
+
+    async def write_gatt_char(self, char_specifier, data, response: bool = None):
+        self.written.append((char_specifier, bytes(data)))
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        self._callbacks[char_specifier] = callback
+        if self._player is None:
+            self._player = asyncio.get_running_loop().create_task(self._play())
+
+    async def stop_notify(self, char_specifier):
+        self._callbacks.pop(char_specifier, None)
+
+    def _requested_measurements(self) -> set:
+        return {data[1] for uuid, data in self.written
+                if uuid == DeviceH10.PMD_CONTROL_UUID and len(data) > 1 and data[0] == DeviceH10.PMD_START_MEASUREMENT}
+
+    async def _play(self):
+        measurements = self._requested_measurements()
+        start = time.perf_counter()
+        for packet in self._packets:
+            if self._speed:
+                delay = packet.time / self._speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)
+            callback = self._callbacks.get(packet.uuid)
+            if callback is None:
+                continue
+            if packet.uuid == DeviceH10.PMD_DATA_UUID and packet.data[0] not in measurements:
+                continue  # not started by the device
+            self.packets_sent += 1
+            # Like bleak: coroutine callbacks are scheduled, not awaited, by the notification dispatcher.
+            result = callback(packet.uuid, bytearray(packet.data))
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+        if self._pending:
+            await asyncio.wait(list(self._pending))
+        if self._finished_callback is not None:
+            self._finished_callback(self)
+        self.is_connected = False
+        self._player = None
+        if self._disconnected_callback is not None:
+            self._disconnected_callback(self)
+
+
+async def _benchmark(args):
+    packets = synthetic_packets(args.duration, acc_sampling_frequency=args.acc)
+    devices = [DeviceH10("00:00:00:00:00:{0:02X}".format(k), acc_sampling_frequency=args.acc)
+               for k in range(args.straps)]
+    factory = FakeBleakClient.factory(packets, speed=args.speed or None)
+    start = time.perf_counter()
+    await asyncio.gather(*(device.connect_async(client_factory=factory) for device in devices))
+    elapsed = time.perf_counter() - start
+    samples = sum(device.ecg_buffer.cursor + device.acc_buffer.cursor for device in devices)
+    print("{0} strap(s), {1} packets each: {2:.3f} s wall, {3:.0f} packets/s, {4:.0f} samples/s".format(
+        args.straps, len(packets), elapsed, args.straps * len(packets) / elapsed, samples / elapsed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay synthetic H10 notifications through DeviceH10.")
+    parser.add_argument("--straps", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=60.0, help="recording length (s)")
+    parser.add_argument("--speed", type=float, default=0.0, help="replay speed; 0 = as fast as possible")
+    parser.add_argument("--acc", type=int, default=None, help="ACC sampling frequency (Hz)")
+    asyncio.run(_benchmark(parser.parse_args()))
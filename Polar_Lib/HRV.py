@@ -0,0 +1,125 @@
+import math
+from collections import deque
+
+
+class HRVWindow:
+    """ Time-domain HRV over the beats of the last `window_seconds`, maintained with running sums.
+
+    Adding a beat and evicting the beats that left the window are O(1) each, so the cost per beat does not depend on
+    the window length. Successive differences are only formed between beats that are actually consecutive: when
+    beats are missing (dropout, rejected artifact) the pair spanning the hole is left out of RMSSD and pNN50.
+    """
+
+    def __init__(self, window_seconds: float = 60.0):
+        self.window_seconds = window_seconds
+        # [beat time, IBI (ms), successive difference with the previous beat (ms) or None]
+        self._beats = deque()
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._diff_count = 0
+        self._diff_sum_sq = 0.0
+        self._nn50 = 0
+        self._last = None  # (time, ibi) of the most recent beat, kept even once it leaves the window
+
+    def __len__(self):
+        return len(self._beats)
+
+    def add(self, beat_time: float, ibi: float):
+        diff = None
+        if self._last is not None:
+            last_time, last_ibi = self._last
+            # Consecutive beats are one interval apart; allow half an interval of timestamp jitter.
+            if abs((beat_time - last_time) * 1000.0 - ibi) <= 0.5 * ibi:
+                diff = ibi - last_ibi
+        self._last = (beat_time, ibi)
+
+        self._beats.append([beat_time, ibi, None])
+        self._sum += ibi
+        self._sum_sq += ibi * ibi
+        if diff is not None and len(self._beats) > 1:
+            self._add_diff(self._beats[-1], diff)
+        self._evict(beat_time - self.window_seconds)
+
+    def _add_diff(self, beat, diff):
+        beat[2] = diff
+        self._diff_count += 1
+        self._diff_sum_sq += diff * diff
+        if abs(diff) > 50.0:
+            self._nn50 += 1
+
+    def _remove_diff(self, beat):
+        diff = beat[2]
+        beat[2] = None
+        self._diff_count -= 1
+        self._diff_sum_sq -= diff * diff
+        if abs(diff) > 50.0:
+            self._nn50 -= 1
+
+    def _evict(self, oldest_time: float):
+        while self._beats and self._beats[0][0] < oldest_time:
+            beat = self._beats.popleft()
+            self._sum -= beat[1]
+            self._sum_sq -= beat[1] * beat[1]
+            if beat[2] is not None:
+                self._remove_diff(beat)
+            # The new first beat's difference pairs it with the evicted one.
+            if self._beats and self._beats[0][2] is not None:
+                self._remove_diff(self._beats[0])
+
+    @property
+    def mean_ibi(self) -> float:
+        n = len(self._beats)
+        return self._sum / n if n else math.nan
+
+    @property
+    def mean_hr(self) -> float:
+        """ Beats per minute, from the mean interval. """
+        return 60000.0 / self.mean_ibi if self._beats else math.nan
+
+    @property
+    def sdnn(self) -> float:
+        n = len(self._beats)
+        if n < 2:
+            return math.nan
+        return math.sqrt(max(0.0, (self._sum_sq - self._sum * self._sum / n) / (n - 1)))
+
+    @property
+    def rmssd(self) -> float:
+        if self._diff_count == 0:
+            return math.nan
+        return math.sqrt(max(0.0, self._diff_sum_sq / self._diff_count))
+
+    @property
+    def pnn50(self) -> float:
+        """ Percentage of successive differences larger than 50 ms. """
+        if self._diff_count == 0:
+            return math.nan
+        return 100.0 * self._nn50 / self._diff_count
+
+    def metrics(self) -> dict:
+        return {"rmssd": self.rmssd, "sdnn": self.sdnn, "pnn50": self.pnn50, "mean_hr": self.mean_hr,
+                "beats": len(self._beats)}
+
+
+class StreamingHRV:
+    """ Rolling HRV metrics over one or more windows, fed with IBI batches as they arrive. """
+
+    def __init__(self, windows=(60.0, 300.0), min_ibi: float = 300.0, max_ibi: float = 2000.0):
+        self.windows = {window: HRVWindow(window) for window in windows}
+        # IBIs outside [min_ibi, max_ibi] ms are physiologically implausible and treated as artifacts.
+        self.min_ibi = min_ibi
+        self.max_ibi = max_ibi
+        self.rejected = 0
+
+    def update(self, beat_times, ibi_values):
+        for beat_time, ibi in zip(beat_times, ibi_values):
+            ibi = float(ibi)
+            if not self.min_ibi <= ibi <= self.max_ibi:
+                self.rejected += 1
+                continue
+            for window in self.windows.values():
+                window.add(float(beat_time), ibi)
+
+    def metrics(self) -> dict:
+        """ {window_seconds: {"rmssd", "sdnn", "pnn50", "mean_hr", "beats"}} """
+        return {seconds: window.metrics() for seconds, window in self.windows.items()}
@@ -0,0 +1,71 @@
+import contextlib
+import math
+
+import numpy as np
+
+from .PolarLib import DeviceH10
+from .RingBuffer import RingBuffer
+
+
+class LiveFeed:
+    """ `received_data_cb` that forwards new device data to display buffers, a recording and a status array.
+
+    The display buffers are "ecg", "hr", "hrv" (RMSSD over the shortest HRV window, one value per HR notification)
+    and "rr" (beats detected in the ECG, with their RR interval). They can be plain `RingBuffer`s shared with a GUI
+    thread under `lock`, or `SharedRingBuffer`s read by another process. `status` holds the latest scalar values,
+    indexed by `STATUS_FIELDS` (NaN until known).
+    """
+
+    STATUS_FIELDS = ("battery_level", "hr", "ibi", "rr", "packets_per_s", "samples_lost", "connected")
+
+    def __init__(self, buffers: dict, writer=None, status=None, lock=None):
+        self.buffers = buffers
+        self.writer = writer
+        self.status = np.full(len(self.STATUS_FIELDS), math.nan) if status is None else status
+        self._lock = lock or contextlib.nullcontext()
+        self._cursors = {"ecg": 0, "hr": 0, "rr": 0}
+
+    @staticmethod
+    def create_buffers(seconds: float, buffer_class=RingBuffer) -> dict:
+        """ Display buffers holding `seconds` of each stream. """
+        return {"ecg": buffer_class(int(seconds * DeviceH10.ECG_SAMPLING_FREQUENCY), np.int32),
+                "hr": buffer_class(int(seconds * DeviceH10.HR_MAX_RATE)),
+                "hrv": buffer_class(int(seconds * DeviceH10.HR_MAX_RATE)),
+                "rr": buffer_class(int(seconds * DeviceH10.IBI_MAX_RATE))}
+
+    def get(self, field: str):
+        """ Latest value of a status field, None while unknown. """
+        value = self.status[self.STATUS_FIELDS.index(field)]
+        return None if math.isnan(value) else value
+
+    def _set(self, field: str, value):
+        self.status[self.STATUS_FIELDS.index(field)] = math.nan if value is None else value
+
+    def __call__(self, device: DeviceH10):
+        # Catch up on everything the device buffered since the last call, so no packet is missed or repeated.
+        timestamps, values, self._cursors["ecg"] = device.ecg_buffer.read_since(self._cursors["ecg"])
+        beat_times, rr_values, self._cursors["rr"] = device.rr_buffer.read_since(self._cursors["rr"])
+        hr_times, hr_values, self._cursors["hr"] = device.hr_buffer.read_since(self._cursors["hr"])
+        with self._lock:
+            self.buffers["ecg"].extend(timestamps, values)
+            self.buffers["rr"].extend(beat_times, rr_values)
+            if len(hr_times):
+                self.buffers["hr"].extend(hr_times, hr_values)
+                # RMSSD over the shortest HRV window, sampled with each HR notification.
+                rmssd = device.hrv.metrics()[min(device.hrv.windows)]["rmssd"]
+                if np.isfinite(rmssd):
+                    self.buffers["hrv"].extend(hr_times[-1:], [rmssd])
+
+        writer = self.writer  # May be detached from another thread meanwhile
+        if writer is not None:
+            writer.write(timestamps, values, sensor_time=device.last_ecg_sensor_time)
+
+        ecg_stats = device.telemetry.stream("ecg")
+        self._set("battery_level", device.battery_level)
+        self._set("hr", device.last_hr_value)
+        self._set("ibi", device.last_ibi_value)
+        if len(rr_values):
+            self._set("rr", rr_values[-1])
+        self._set("packets_per_s", ecg_stats.packets_per_s)
+        self._set("samples_lost", ecg_stats.samples_lost)
+        self._set("connected", device.is_connected)
@@ -1,10 +1,20 @@
 import asyncio
+import contextlib
 import math
 import numpy as np
 import time
+from typing import NamedTuple, Optional
 
 from bleak import BleakClient, BleakError
 from bleak.uuids import uuid16_dict
+
+from .ClockSync import ClockSync
+from .HRV import StreamingHRV
+from .RestartPolicy import RestartPolicy
+from .RingBuffer import RingBuffer
+from .RPeaks import RPeakDetector
+from .Telemetry import Telemetry
+from .StreamQueue import OverflowPolicy, StreamBatch, StreamSubscription
 """ 
 MIT License
 
@@ -39,6 +49,20 @@ HEART_RATE_DEVICE_PATTERN = "0000{0:x}-0000-1000-8000-00805f9b34fb"
 PMD_DEVICE_PATTERN = "FB005C8{0:x}-02E7-F387-1CAD-8ACD2D8DF0C8"
 
 
+class StreamGap(NamedTuple):
+    """ Samples missing from a PMD stream, located by the sensor timestamps on either side of the hole.
+
+    `samples_lost` is None when the loss is unknown: the sensor clock went backwards (strap reset), so the
+    timestamps on either side cannot be compared.
+    """
+    stream: str
+    sensor_time_before: float  # last sample received before the gap (s, sensor clock)
+    sensor_time_after: float  # first sample received after the gap (s, sensor clock)
+    samples_lost: Optional[int]  # None if unknown (sensor clock reset)
+    host_time: float  # time.time() when the gap was detected
+    reconnect: bool  # True if the gap spans a reconnection
+
+
 class DeviceH10:
     ECG_SAMPLING_FREQUENCY = 130
 
@@ -74,18 +98,112 @@ class DeviceH10:
     ECG_WRITE = bytearray([0x02, 0x00, 0x00, 0x01, 0x82,
                            0x00, 0x01, 0x01, 0x0E, 0x00])
 
-    def __init__(self, mac_address: str, debug_mode: bool = False):
+    # PMD measurement types (first byte of a PMD data frame)
+    PMD_ECG = 0x00
+    PMD_ACC = 0x02
+
+    # PMD control point settings
+    PMD_START_MEASUREMENT = 0x02
+    PMD_SETTING_SAMPLE_RATE = 0x00
+    PMD_SETTING_RESOLUTION = 0x01
+    PMD_SETTING_RANGE = 0x02
+
+    # PMD frame type flag: the frame holds a reference sample followed by bit-packed deltas.
+    PMD_FRAME_COMPRESSED = 0x80
+
+    ECG_RESOLUTION = 14
+    ACC_SAMPLING_FREQUENCIES = (25, 50, 100, 200)
+    ACC_RANGES = (2, 4, 8)  # G
+    ACC_RESOLUTION = 16
+
+    # Upper bound on HR notifications / IBIs per second, used to size the HR and IBI history buffers.
+    HR_MAX_RATE = 2
+    IBI_MAX_RATE = 5
+
+    # Names accepted by `stream()`.
+    STREAMS = ("ecg", "acc", "hr", "ibi", "rr")
+    PMD_STREAMS = ("ecg", "acc")
+
+    def __init__(self, mac_address: str, debug_mode: bool = False, buffer_seconds: float = 600.0,
+                 connect_lock: asyncio.Lock = None, restart_policy: RestartPolicy = None,
+                 ecg: bool = True, acc_sampling_frequency: int = None, acc_range: int = 8, client_factory=None,
+                 hrv_windows=(60.0, 300.0), detect_beats: bool = True, supervised: bool = False):
         self._mac_address: str = mac_address
+        # Callable(address, disconnected_callback=...) returning a BleakClient-compatible object.
+        self._client_factory = client_factory or BleakClient
+        if acc_sampling_frequency is not None and acc_sampling_frequency not in self.ACC_SAMPLING_FREQUENCIES:
+            raise ValueError("Unsupported ACC sampling frequency: {0}".format(acc_sampling_frequency))
+        if acc_range not in self.ACC_RANGES:
+            raise ValueError("Unsupported ACC range: {0}".format(acc_range))
+        self.acc_sampling_frequency = acc_sampling_frequency
+        # PMD start commands, re-sent as-is on every (re)connection.
+        self.pmd_commands = []
+        if ecg:
+            self.pmd_commands.append(self.ECG_WRITE)
+        if acc_sampling_frequency is not None:
+            self.pmd_commands.append(DeviceH10.pmd_start_command(
+                self.PMD_ACC, acc_sampling_frequency, self.ACC_RESOLUTION, acc_range))
+        self._connect_lock = connect_lock
+        # No policy: a dropped connection ends `connect_async`, as a stop request would.
+        self._restart_policy = restart_policy
+        # Supervised (by `H10Session`): `connect_async` may be run again after it returns without a stop request, so
+        # the streams stay open until a stop or `close_streams()`, and the next run records the gap.
+        self._supervised = supervised
+        self._streams_open = True
         self._debug_mode: bool = debug_mode
         self._loop = None
         self._stop = False
+        # stop() calls so far, and how many of them a finished run has acted on: a stop() issued while no run was
+        # there to see it (before connecting, or between two runs) stops the next run instead of being lost.
+        self._stop_requests = 0
+        self._stops_handled = 0
+        self._stop_event = asyncio.Event()
+        self._connected_event = asyncio.Event()
+        self._stopped_event = asyncio.Event()
+        self._stopped_event.set()
+        self._task = None
+        self._disconnected_event = asyncio.Event()
+        self.is_reconnecting = False
+        self.reconnects = 0
+        self.gaps = []
+        self._last_sample_time = {}
+        self._reconnected = set()
+        # Maps PMD sensor timestamps to host time (time.time()), the timebase of every stream and buffer.
+        self.clock = ClockSync()
+        # Packet rates, samples lost, decode / handler / callback / queue timings and event-loop lag.
+        self.telemetry = Telemetry()
+        self.is_connected = False
+        self.battery_level = None
         self.last_hr_value = None
         self.last_ibi_value = None
         self.last_ecg_values = None
+        self.last_ecg_sensor_time = None  # sensor timestamp (s) of the last sample of `last_ecg_values`
         self._received_data_cb = None
         self.hr_stream_times = None
         self.ecg_stream_times = None
         self.ibi_stream_times = None
+        # Sample history, constant in memory regardless of session length.
+        self.ecg_buffer = RingBuffer(math.ceil(buffer_seconds * self.ECG_SAMPLING_FREQUENCY), dtype=np.int32)
+        self.hr_buffer = RingBuffer(math.ceil(buffer_seconds * self.HR_MAX_RATE))
+        self.ibi_buffer = RingBuffer(math.ceil(buffer_seconds * self.IBI_MAX_RATE))
+        self.last_acc_values = None
+        self.acc_stream_times = None
+        # Rolling RMSSD / SDNN / pNN50 / mean HR, updated with every IBI notification.
+        self.hrv = StreamingHRV(hrv_windows)
+        # R peaks found in the ECG itself: beat times and ECG-derived RR intervals (ms), to check against the IBIs.
+        self.beat_detector = RPeakDetector(self.ECG_SAMPLING_FREQUENCY) if detect_beats else None
+        self.rr_buffer = RingBuffer(math.ceil(buffer_seconds * self.IBI_MAX_RATE))
+        self.acc_buffer = RingBuffer(math.ceil(buffer_seconds * (acc_sampling_frequency or 1)), dtype=np.int32,
+                                     channels=3)
+        self._subscriptions = {name: [] for name in self.STREAMS}
+
+    @property
+    def mac_address(self) -> str:
+        return self._mac_address
+
+    @property
+    def stop_requested(self) -> bool:
+        return self._stop
 
     @property
     def received_data_cb(self):
@@ -98,74 +216,324 @@ class DeviceH10:
 
         self._received_data_cb = value
 
-    async def connect_async(self):
-        """ Connect to device and received data from the device. """
+    def stream(self, name: str, maxsize: int = 64, overflow: str = OverflowPolicy.DROP_OLDEST) -> StreamSubscription:
+        """ Subscribe to a data stream ("ecg", "acc", "hr", "ibi" or "rr").
+
+        Use as `async for batch in device.stream("ecg"):` from the event loop running `connect_async`. Each batch is
+        a `StreamBatch(times, values)` of NumPy arrays. The iteration ends when the device stops for good (stop request,
+        restart policy exhausted, or for a supervised device `close_streams()`) or the subscription is closed.
+        """
+        if name not in self._subscriptions:
+            raise ValueError("Unknown stream: {0}".format(name))
+        subscription = StreamSubscription(maxsize, overflow, on_close=self._subscriptions[name].remove,
+                                          latency=self.telemetry.stream(name).queue)
+        self._subscriptions[name].append(subscription)
+        return subscription
+
+    async def _publish(self, name: str, times, values):
+        """ Hand a batch to every subscriber of `name`. """
+        subscriptions = self._subscriptions[name]
+        if not subscriptions:
+            return
+        batch = StreamBatch(np.asarray(times), np.asarray(values))
+        for subscription in list(subscriptions):
+            await subscription.put(batch)
+
+    def close_streams(self):
+        """ End every subscription (their iteration stops once the batches already queued are delivered). """
+        self._streams_open = False
+        for subscriptions in self._subscriptions.values():
+            for subscription in list(subscriptions):
+                subscription.close()
+
+    def _reset_lifecycle(self):
+        self._loop = asyncio.get_running_loop()
+        if self._stop_requests == self._stops_handled:
+            self._stop = False
+            self._stop_event.clear()
+        else:
+            self._stop = True
+            self._stop_event.set()
+        self._connected_event.clear()
+        self._stopped_event.clear()
+        if self._streams_open and self._last_sample_time:
+            # Restarted by a supervisor: the streams go on, and their first frames record the gap
+            self._reconnected = set(self.PMD_STREAMS)
+        else:
+            self._last_sample_time = {}
+            self._reconnected = set()
+        self._streams_open = True
+
+    async def connect_async(self, client_factory=None):
+        """ Connect to device and received data from the device.
+
+        `client_factory` replaces `BleakClient` for this and later connections (e.g. `FakeClient.FakeBleakClient`).
+        """
+        if client_factory is not None:
+            self._client_factory = client_factory
+        self._reset_lifecycle()
+        await self._run_async()
+
+    async def _run_async(self):
+        """ Stream until stopped, reconnecting with backoff according to the restart policy. """
+        attempts = 0
+        loop_monitor = asyncio.ensure_future(self.telemetry.monitor_loop())
+        try:
+            while not self._stop_event.is_set():
+                streamed = await self._connect_once()
+                if self._stop_event.is_set() or self._restart_policy is None:
+                    break
+                # A connection that streamed resets the backoff; repeated failures to connect do not.
+                attempts = 1 if streamed else attempts + 1
+                if not self._restart_policy.should_restart(attempts):
+                    break
+                delay = self._restart_policy.delay_for(attempts)
+                print("{0}: connection lost, reconnecting in {1:.1f} s".format(self._mac_address, delay))
+                self.is_reconnecting = True
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+                self.reconnects += 1
+                self._reconnected = set(self.PMD_STREAMS)
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            print("Interrupt App - PolarH10!")
+        finally:
+            loop_monitor.cancel()
+            if self._stop:
+                self._stops_handled = self._stop_requests
+            self.is_reconnecting = False
+            if self._stop or not self._supervised:
+                self.close_streams()
+            self._stopped_event.set()
+
+    async def _connect_once(self) -> bool:
+        """ One connection: set up the PMD stream and wait for a stop request or a disconnect.
+
+        Returns True if the device streamed before the connection ended.
+        """
         if self._debug_mode:
             print("Connecting to device: {0}".format(self._mac_address))
-        self._stop = False
 
+        self._disconnected_event.clear()
+        bluetooth_client = self._client_factory(self._mac_address,
+                                                disconnected_callback=lambda _: self._disconnected_event.set())
+        streamed = False
         try:
-            async with BleakClient(self._mac_address) as bluetooth_client:
+            # Several straps sharing one adapter must not run their connection handshakes concurrently.
+            async with self._connect_lock or contextlib.nullcontext():
+                await bluetooth_client.connect()
                 model_number = await bluetooth_client.read_gatt_char(self.MODEL_NBR_UUID)
                 manufacturer_name = await bluetooth_client.read_gatt_char(self.MANUFACTURER_NAME_UUID)
                 battery_level = await bluetooth_client.read_gatt_char(self.BATTERY_LEVEL_UUID)
+                self.battery_level = int(battery_level[0])
+                if self._stop_event.is_set():
+                    return streamed  # Stopped while connecting: do not start streaming
 
                 if self._debug_mode:
                     print(">>> Model Number: {0}".format(DeviceH10.conv2string(model_number)), flush=True)
                     print(">>> Manufacturer Name: {0}".format(DeviceH10.conv2string(manufacturer_name)), flush=True)
-                    print(">>> Battery Level: {0}%".format(int(battery_level[0])), flush=True)
+                    print(">>> Battery Level: {0}%".format(self.battery_level), flush=True)
 
                 await bluetooth_client.read_gatt_char(self.PMD_CONTROL_UUID)
-                await bluetooth_client.write_gatt_char(self.PMD_CONTROL_UUID, self.ECG_WRITE)
-                await bluetooth_client.start_notify(self.PMD_DATA_UUID, self.ecg_recv_data_conv)
+                for command in self.pmd_commands:
+                    await bluetooth_client.write_gatt_char(self.PMD_CONTROL_UUID, command, response=True)
+                await bluetooth_client.start_notify(self.PMD_DATA_UUID, self.pmd_recv_data_conv)
                 await bluetooth_client.start_notify(self.HEART_RATE_MEASUREMENT_UUID, self.hr_recv_data_conv)
-                await asyncio.wait_for(self.wait_stop_request(), timeout=None)
+            self.is_connected = True
+            self.is_reconnecting = False
+            streamed = True
+            self._connected_event.set()
+            await self._wait_stop_or_disconnect()
+            if bluetooth_client.is_connected:
                 await bluetooth_client.stop_notify(self.PMD_DATA_UUID)
                 await bluetooth_client.stop_notify(self.HEART_RATE_MEASUREMENT_UUID)
-                await bluetooth_client.disconnect()
         except BleakError as ex:
             print(ex)
         except asyncio.TimeoutError:
             pass  # Could handle timeout if desired.
-        except (asyncio.CancelledError, KeyboardInterrupt):
-            print("Interrupt App - PolarH10!")
+        finally:
+            self.is_connected = False
+            try:
+                await bluetooth_client.disconnect()
+            except BleakError:
+                pass
+        return streamed
+
+    async def _wait_stop_or_disconnect(self):
+        stop = asyncio.ensure_future(self.wait_stop_request())
+        disconnected = asyncio.ensure_future(self._disconnected_event.wait())
+        try:
+            await asyncio.wait((stop, disconnected), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop.cancel()
+            disconnected.cancel()
 
     async def wait_stop_request(self):
         """ Wait to received to Stop command. """
-        while not self._stop:
-            await asyncio.sleep(1)
+        await self._stop_event.wait()
+
+    def start(self, client_factory=None) -> asyncio.Task:
+        """ Run `connect_async` as a task on the running event loop; the task completes once disconnected. """
+        if self._task is not None and not self._task.done():
+            return self._task
+        if client_factory is not None:
+            self._client_factory = client_factory
+        # Reset now rather than in the task, so a stop() issued before the task first runs is not lost.
+        self._reset_lifecycle()
+        self._task = self._loop.create_task(self._run_async())
+        return self._task
+
+    async def wait_connected(self) -> bool:
+        """ Wait until streaming has started or the connection attempt ended. Returns True if streaming. """
+        connected = asyncio.ensure_future(self._connected_event.wait())
+        stopped = asyncio.ensure_future(self._stopped_event.wait())
+        try:
+            await asyncio.wait((connected, stopped), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            connected.cancel()
+            stopped.cancel()
+        return self.is_connected
+
+    async def wait_stopped(self):
+        """ Wait until the device is disconnected. Returns immediately if it is not running. """
+        await self._stopped_event.wait()
+
+    async def stop_async(self):
+        """ Request a stop and wait until the device is disconnected. """
+        self.stop()
+        await self.wait_stopped()
+
+    async def __aenter__(self):
+        self.start()
+        await self.wait_connected()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop_async()
+
+    async def pmd_recv_data_conv(self, sender, data: bytearray):
+        """ Dispatch a PMD data frame to the decoder of its measurement type. """
+        if data[0] == self.PMD_ECG:
+            await self.ecg_recv_data_conv(sender, data)
+        elif data[0] == self.PMD_ACC:
+            await self.acc_recv_data_conv(sender, data)
 
     async def ecg_recv_data_conv(self, sender, data: bytearray):
         """ Received data and convert them to timestamp and ECG values. """
-        ecg_stream_values = []
-        ecg_stream_times = []
-        if data[0] == 0x00:
+        if data[0] == self.PMD_ECG:
+            host_time = time.time()
+            start = time.perf_counter()
+            stats = self.telemetry.stream("ecg")
             if self._debug_mode:
                 print("Data received ECG...")
             timestamp = DeviceH10.conv2int(data, 1, 8, signed=False) / 1.0e9
-            step = 3
-            time_step = 1.0 / self.ECG_SAMPLING_FREQUENCY
-            samples = data[10:]
-            n_samples = math.floor(len(samples) / step)
-            offset = 0
-            sample_timestamp = timestamp - (n_samples - 1) * time_step
-            while offset < len(samples):
-                ecg = DeviceH10.conv2int(samples, offset, step, signed=True)
-                offset += step
-                ecg_stream_values.extend([ecg])
-                ecg_stream_times.extend([sample_timestamp])
-                sample_timestamp += time_step
+            frame_type = data[9]
+            if frame_type == 0x00:
+                ecg_stream_values = DeviceH10.conv2int24_array(data, 10)
+            elif frame_type == self.PMD_FRAME_COMPRESSED:
+                ecg_stream_values = DeviceH10.decode_delta_frame(data, 10, 1, self.ECG_RESOLUTION)[:, 0]
+            else:
+                return
+            stats.decode.record(time.perf_counter() - start)
+            stats.record_packet(len(ecg_stream_values), start)
+            sensor_times = DeviceH10.sample_times(timestamp, len(ecg_stream_values), self.ECG_SAMPLING_FREQUENCY)
+            self._check_gap("ecg", sensor_times, self.ECG_SAMPLING_FREQUENCY)
+            self.clock.update(timestamp, host_time)
+            ecg_stream_times = self.clock.to_host(sensor_times)
 
             if self._debug_mode:
                 print("ECG|{0} len={2}|{1} len={3}".format(ecg_stream_times, ecg_stream_values,
                                                            len(ecg_stream_times), len(ecg_stream_values)))
 
             self.last_ecg_values = ecg_stream_values
+            self.last_ecg_sensor_time = timestamp
             self.ecg_stream_times = ecg_stream_times
+            self.ecg_buffer.extend(ecg_stream_times, ecg_stream_values)
+            await self._publish("ecg", ecg_stream_times, ecg_stream_values)
+            if self.beat_detector is not None:
+                # Detection runs on sensor time, which has no jitter; only the beats are mapped to host time.
+                beat_times, rr_values = self.beat_detector.update(sensor_times, ecg_stream_values)
+                if len(beat_times):
+                    beat_times = self.clock.to_host(beat_times)
+                    self.rr_buffer.extend(beat_times, rr_values)
+                    await self._publish("rr", beat_times, rr_values)
+            stats.handler.record(time.perf_counter() - start)
+
+            self._notify_received(stats)
+
+    async def acc_recv_data_conv(self, sender, data: bytearray):
+        """ Received data and convert them to timestamp and (n, 3) accelerometer values in mG. """
+        if data[0] != self.PMD_ACC or self.acc_sampling_frequency is None:
+            return
+        host_time = time.time()
+        start = time.perf_counter()
+        stats = self.telemetry.stream("acc")
+        if self._debug_mode:
+            print("Data received ACC...")
+        timestamp = DeviceH10.conv2int(data, 1, 8, signed=False) / 1.0e9
+        frame_type = data[9]
+        if frame_type & self.PMD_FRAME_COMPRESSED:
+            acc_stream_values = DeviceH10.decode_delta_frame(data, 10, 3, self.ACC_RESOLUTION)
+        elif frame_type == 0x00:
+            acc_stream_values = np.frombuffer(data, dtype=np.int8, offset=10).reshape(-1, 3).astype(np.int32)
+        elif frame_type == 0x01:
+            n_values = (len(data) - 10) // 2
+            acc_stream_values = np.frombuffer(data, dtype="<i2", count=n_values, offset=10).reshape(-1, 3)
+            acc_stream_values = acc_stream_values.astype(np.int32)
+        elif frame_type == 0x02:
+            acc_stream_values = DeviceH10.conv2int24_array(data, 10).reshape(-1, 3)
+        else:
+            return
+        stats.decode.record(time.perf_counter() - start)
+        stats.record_packet(len(acc_stream_values), start)
+        sensor_times = DeviceH10.sample_times(timestamp, len(acc_stream_values), self.acc_sampling_frequency)
+        self._check_gap("acc", sensor_times, self.acc_sampling_frequency)
+        self.clock.update(timestamp, host_time)
+        acc_stream_times = self.clock.to_host(sensor_times)
+
+        self.last_acc_values = acc_stream_values
+        self.acc_stream_times = acc_stream_times
+        self.acc_buffer.extend(acc_stream_times, acc_stream_values)
+        await self._publish("acc", acc_stream_times, acc_stream_values)
+        stats.handler.record(time.perf_counter() - start)
+
+        self._notify_received(stats)
+
+    def _notify_received(self, stats):
+        """ Run `received_data_cb`, timing it. """
+        if self.received_data_cb is not None:
+            start = time.perf_counter()
+            self.received_data_cb(self)
+            stats.callback.record(time.perf_counter() - start)
 
-            if self.received_data_cb is not None:
-                self.received_data_cb(self)
-                await asyncio.sleep(0.1)
+    def _check_gap(self, stream: str, stream_times: np.ndarray, sampling_frequency: float):
+        """ Record a `StreamGap` if samples are missing between the previous frame of `stream` and this one. """
+        if len(stream_times) == 0:
+            return
+        reconnect = stream in self._reconnected
+        self._reconnected.discard(stream)
+        previous = self._last_sample_time.get(stream)
+        self._last_sample_time[stream] = stream_times[-1]
+        if previous is None:
+            return
+        elapsed = stream_times[0] - previous
+        if elapsed < 0:
+            samples_lost = None
+            # The strap restarted its clock: the old sensor-to-host model no longer applies.
+            self.clock.reset()
+        else:
+            samples_lost = int(round(elapsed * sampling_frequency)) - 1
+            # Less than half a sample of drift between frames is jitter, not loss.
+            if samples_lost <= 0 and not reconnect:
+                return
+        gap = StreamGap(stream, float(previous), float(stream_times[0]), samples_lost, time.time(), reconnect)
+        self.gaps.append(gap)
+        self.telemetry.stream(stream).record_gap(samples_lost)
+        print("{0}: {1} gap of {2} samples between sensor times {3:.3f} s and {4:.3f} s{5}".format(
+            self._mac_address, stream.upper(), "?" if samples_lost is None else samples_lost,
+            gap.sensor_time_before, gap.sensor_time_after, " (reconnect)" if reconnect else ""))
 
     async def hr_recv_data_conv(self, sender, data: bytearray):
         """
@@ -187,6 +555,9 @@ class DeviceH10:
             One IBI is encoded by 2 consecutive bytes. Up to 18 bytes depending on presence of uint16 HR format and
             energy expenditure.
         """
+        host_time = time.time()
+        start = time.perf_counter()
+        stats = self.telemetry.stream("hr")
         byte0 = data[0]  # heart rate format
         uint8_format = (byte0 & 1) == 0
         energy_expenditure = ((byte0 >> 3) & 1) == 1
@@ -214,19 +585,19 @@ class DeviceH10:
         hr_stream_times = []
 
         hr_stream_values.extend([hr])
-        hr_stream_times.extend([time.time_ns() / 1.0e9])
+        hr_stream_times.extend([host_time])
 
-        ibi_stream_values = []
-        ibi_stream_times = []
+        # Polar H7, H9, and H10 record IBIs in 1/1024 seconds format.
+        # Convert 1/1024 sec format to milliseconds.
+        # transmit data in milliseconds.
+        n_ibi = (len(data) - first_rr_byte) // 2
+        ibi_stream_values = np.ceil(np.frombuffer(data, dtype="<u2", count=n_ibi, offset=first_rr_byte) * (1000 / 1024))
 
-        for i in range(first_rr_byte, len(data), 2):
-            ibi = (data[i + 1] << 8) | data[i]
-            # Polar H7, H9, and H10 record IBIs in 1/1024 seconds format.
-            # Convert 1/1024 sec format to milliseconds.
-            # transmit data in milliseconds.
-            ibi = np.ceil(ibi / 1024 * 1000)
-            ibi_stream_values.extend([ibi])
-            ibi_stream_times.extend([time.time_ns() / 1.0e9])
+        # The last interval ends with the beat that triggered this notification; earlier beats precede it.
+        ibi_stream_times = DeviceH10.beat_times(host_time, ibi_stream_values)
+        stats.decode.record(time.perf_counter() - start)
+        stats.record_packet(1, start)
+        self.telemetry.stream("ibi").record_packet(len(ibi_stream_values), start)
 
         if self._debug_mode:
             print("HR |{0} len={2}|{1} len={3}".format(hr_stream_times, hr_stream_values,
@@ -236,22 +607,111 @@ class DeviceH10:
 
         if len(hr_stream_values) > 0:
             self.last_hr_value = hr_stream_values[0]
+            self.hr_buffer.extend(hr_stream_times, hr_stream_values)
+            await self._publish("hr", hr_stream_times, hr_stream_values)
 
         if len(ibi_stream_values) > 0:
             self.last_ibi_value = ibi_stream_values[0]
+            self.ibi_buffer.extend(ibi_stream_times, ibi_stream_values)
+            self.hrv.update(ibi_stream_times, ibi_stream_values)
+            await self._publish("ibi", ibi_stream_times, ibi_stream_values)
+        stats.handler.record(time.perf_counter() - start)
 
-        if self.received_data_cb is not None:
-            self.received_data_cb(self)
-            await asyncio.sleep(0.1)
+        self._notify_received(stats)
 
     def stop(self):
+        """ Request a disconnect. Safe to call from any thread, also before `connect_async` or `start()`. """
         self._stop = True
+        self._stop_requests += 1
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            self._stop_event.set()
+        else:
+            loop.call_soon_threadsafe(self._stop_event.set)
 
     @staticmethod
     def conv2int(data, offset, length, signed: bool):
         """ Convert byte array to an integer (signed or not). """
         return int.from_bytes(bytearray(data[offset: offset + length]), byteorder="little", signed=signed)
 
+    @staticmethod
+    def conv2int24_array(data, offset: int = 0) -> np.ndarray:
+        """ Convert packed little-endian signed 24-bit samples to an int32 array in one pass. """
+        n_samples = (len(data) - offset) // 3
+        raw = np.frombuffer(data, dtype=np.uint8, count=n_samples * 3, offset=offset).reshape(n_samples, 3)
+        values = raw[:, 0].astype(np.int32)
+        values |= raw[:, 1].astype(np.int32) << 8
+        values |= raw[:, 2].astype(np.int32) << 16
+        # Sign extension: flip then subtract bit 23 so 0x800000..0xFFFFFF map to negative values.
+        values ^= 0x800000
+        values -= 0x800000
+        return values
+
+    @staticmethod
+    def sample_times(last_timestamp: float, n_samples: int, sampling_frequency: float) -> np.ndarray:
+        """ Timestamps of `n_samples` evenly spaced samples ending at `last_timestamp` (seconds). """
+        return last_timestamp - np.arange(n_samples - 1, -1, -1, dtype=np.float64) / sampling_frequency
+
+    @staticmethod
+    def beat_times(last_beat_time: float, ibi_values_ms) -> np.ndarray:
+        """ Time of the beat closing each interval, given the time of the last one. """
+        ibi_seconds = np.asarray(ibi_values_ms, dtype=np.float64) / 1000.0
+        # Each beat precedes the last one by the sum of the intervals that follow it.
+        following = np.cumsum(ibi_seconds[::-1])[::-1] - ibi_seconds
+        return last_beat_time - following
+
+    @staticmethod
+    def decode_delta_frame(data, offset: int, channels: int, resolution: int) -> np.ndarray:
+        """ Decode a delta-compressed PMD frame into an (n, channels) int32 array.
+
+        The frame starts with a reference sample (one signed little-endian integer of `resolution` bits, rounded up
+        to whole bytes, per channel), followed by blocks of [delta bit width (1 byte), sample count (1 byte),
+        bit-packed signed deltas, LSB first, padded to a whole byte]. Each block is decoded with NumPy bit
+        operations; only the loop over blocks (a handful per frame) runs in Python.
+        """
+        ref_bytes = math.ceil(resolution / 8)
+        reference = [DeviceH10.conv2int(data, offset + ch * ref_bytes, ref_bytes, signed=True)
+                     for ch in range(channels)]
+        offset += channels * ref_bytes
+
+        blocks = [np.array([reference], dtype=np.int32)]
+        payload = np.frombuffer(data, dtype=np.uint8)
+        while offset + 2 <= len(data):
+            delta_size = data[offset]
+            sample_count = data[offset + 1]
+            offset += 2
+            n_bits = delta_size * sample_count * channels
+            n_bytes = (n_bits + 7) // 8
+            if delta_size == 0 or offset + n_bytes > len(data):
+                break
+            bits = np.unpackbits(payload[offset:offset + n_bytes], bitorder="little")[:n_bits]
+            weights = np.left_shift(1, np.arange(delta_size, dtype=np.int64))
+            deltas = bits.reshape(-1, delta_size).astype(np.int64) @ weights
+            # Two's complement over `delta_size` bits.
+            deltas -= (deltas >> (delta_size - 1)) << delta_size
+            blocks.append(deltas.reshape(sample_count, channels).astype(np.int32))
+            offset += n_bytes
+        return np.cumsum(np.concatenate(blocks), axis=0, dtype=np.int32)
+
+    @staticmethod
+    def pmd_start_command(measurement_type: int, sampling_frequency: int, resolution: int,
+                          measurement_range: int = None) -> bytearray:
+        """ Build the PMD control point command that starts a measurement with the given settings. """
+        command = bytearray([DeviceH10.PMD_START_MEASUREMENT, measurement_type])
+        settings = [(DeviceH10.PMD_SETTING_SAMPLE_RATE, sampling_frequency),
+                    (DeviceH10.PMD_SETTING_RESOLUTION, resolution)]
+        if measurement_range is not None:
+            settings.append((DeviceH10.PMD_SETTING_RANGE, measurement_range))
+        for setting, value in settings:
+            command += bytearray([setting, 0x01]) + value.to_bytes(2, byteorder="little")
+        return command
+
     @staticmethod
     def conv2string(data):
         return "".join(map(chr, data))
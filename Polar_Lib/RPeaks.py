@@ -0,0 +1,167 @@
+import math
+
+import numpy as np
+
+
+class RPeakDetector:
+    """ Online R-peak detector for the H10 ECG stream, fed batch by batch as frames arrive.
+
+    Pan-Tompkins style: the ECG slope is squared and averaged over `integration_window` seconds, and a QRS complex is
+    a run of that feature above an adaptive threshold placed between running estimates of the QRS peak level and
+    the background level between complexes (learned over the first `learning_seconds`). The R peak is the sample of
+    largest deflection inside the complex, so either lead polarity works. A beat is reported once its complex has
+    ended, i.e. at most `max_qrs + integration_window` seconds after the R peak, and candidates within `refractory`
+    seconds of the previous beat are ignored.
+
+    Only the last fraction of a second of samples is kept, so each update is O(batch). A jump in the sample times
+    (lost frames, strap reset) restarts the filters, and no RR interval is formed across it.
+    """
+
+    # 5-point derivative of Pan & Tompkins (1985).
+    _SLOPE = np.array([2.0, 1.0, 0.0, -1.0, -2.0]) / 8.0
+
+    def __init__(self, sampling_frequency: float = 130.0, refractory: float = 0.25, integration_window: float = 0.15,
+                 max_qrs: float = 0.3, learning_seconds: float = 2.0):
+        self.sampling_frequency = sampling_frequency
+        self._refractory = int(round(refractory * sampling_frequency))
+        self._window = max(1, int(round(integration_window * sampling_frequency)))
+        self._max_qrs = int(round(max_qrs * sampling_frequency))
+        self._learning = int(round(learning_seconds * sampling_frequency))
+        # Raw samples needed to search a complex for its R peak, which precedes the feature by up to one window.
+        self._history = self._max_qrs + self._window + len(self._SLOPE)
+        self.beats = 0
+        self.reset()
+
+    def reset(self):
+        """ Forget everything, including the learned signal and noise levels. """
+        self._signal_level = None
+        self._noise_level = None
+        self._learn_max = 0.0
+        self._learn_sum = 0.0
+        self._learn_count = 0
+        self._restart()
+
+    def _restart(self):
+        """ Restart the filters after a discontinuity; the learned levels are kept. """
+        self._times = np.empty(0)
+        self._values = np.empty(0)
+        self._squared_tail = np.zeros(self._window - 1)
+        self._next_index = 0  # index of the next sample since the (re)start
+        self._last_time = None
+        self._qrs_start = None  # index where the feature rose above the threshold, while inside a complex
+        self._qrs_peak = 0.0
+        self._noise_sum = 0.0
+        self._noise_count = 0
+        self._last_beat_index = None
+        self._last_beat_time = None
+
+    @property
+    def threshold(self) -> float:
+        if self._signal_level is None:
+            return math.inf
+        return self._noise_level + 0.25 * (self._signal_level - self._noise_level)
+
+    def update(self, times, values):
+        """ Feed a batch of samples; returns (beat_times, rr_ms) of the beats completed by it.
+
+        `rr_ms` is the interval from the previous beat. The first beat after a (re)start has no interval and is only
+        used as the start of the next one, so it is not returned.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        if n == 0:
+            return np.empty(0), np.empty(0)
+        if self._last_time is not None:
+            elapsed = times[0] - self._last_time
+            if elapsed < 0 or elapsed > 1.5 / self.sampling_frequency:
+                self._restart()
+        self._last_time = times[-1]
+
+        # Slope, squared, then moving-window integration, continued from the previous batch.
+        tail = self._values[-(len(self._SLOPE) - 1):]
+        if len(tail) < len(self._SLOPE) - 1:
+            tail = np.concatenate([np.full(len(self._SLOPE) - 1 - len(tail), values[0]), tail])
+        squared = np.convolve(np.concatenate([tail, values]), self._SLOPE, mode="valid") ** 2
+        squared = np.concatenate([self._squared_tail, squared])
+        self._squared_tail = squared[len(squared) - (self._window - 1):]
+        integral = np.cumsum(np.concatenate([[0.0], squared]))
+        feature = (integral[self._window:] - integral[:-self._window]) / self._window
+
+        first_index = self._next_index
+        self._next_index += n
+        self._times = np.concatenate([self._times, times])
+        self._values = np.concatenate([self._values, values])
+        history_start = self._next_index - len(self._values)
+
+        beat_times = []
+        rr_values = []
+        if self._signal_level is None:
+            self._learn(feature)
+        else:
+            for beat_index in self._detect(feature, first_index):
+                beat_time = self._times[beat_index - history_start]
+                if self._last_beat_time is not None:
+                    beat_times.append(beat_time)
+                    rr_values.append((beat_time - self._last_beat_time) * 1000.0)
+                self._last_beat_time = beat_time
+
+        self._times = self._times[-self._history:]
+        self._values = self._values[-self._history:]
+        self.beats += len(beat_times)
+        return np.array(beat_times), np.array(rr_values)
+
+    def _learn(self, feature):
+        self._learn_max = max(self._learn_max, float(feature.max()))
+        self._learn_sum += float(feature.sum())
+        self._learn_count += len(feature)
+        if self._learn_count >= self._learning and self._learn_max > 0.0:
+            self._signal_level = 0.25 * self._learn_max
+            self._noise_level = self._learn_sum / self._learn_count
+
+    def _detect(self, feature, first_index):
+        """ Yield the sample index of each R peak whose complex ends within `feature`. """
+        n = len(feature)
+        position = 0
+        while position < n:
+            threshold = self.threshold
+            if self._qrs_start is None:
+                start = position
+                if self._last_beat_index is not None:
+                    start = max(start, self._last_beat_index + self._refractory - first_index)
+                above = np.flatnonzero(feature[start:] > threshold) if start < n else ()
+                rise = start + above[0] if len(above) else n
+                if rise > position:
+                    self._noise_sum += float(feature[position:rise].sum())
+                    self._noise_count += rise - position
+                if rise == n:
+                    return
+                self._qrs_start = first_index + rise
+                self._qrs_peak = 0.0
+                position = rise
+            else:
+                limit = min(n, self._qrs_start + self._max_qrs - first_index)
+                below = np.flatnonzero(feature[position:limit] <= threshold)
+                end = position + below[0] if len(below) else limit
+                if end > position:
+                    self._qrs_peak = max(self._qrs_peak, float(feature[position:end].max()))
+                if not len(below) and limit < self._qrs_start + self._max_qrs - first_index:
+                    return  # The complex continues into the next batch.
+                yield self._end_complex(first_index + end)
+                position = end
+
+    def _end_complex(self, end_index):
+        """ Locate the R peak of the complex that just ended and adapt the levels; returns its sample index. """
+        history_start = self._next_index - len(self._values)
+        lo = max(history_start, self._qrs_start - self._window)
+        segment = self._values[lo - history_start:end_index - history_start]
+        peak_index = lo + int(np.argmax(np.abs(segment - segment.mean())))
+
+        self._signal_level = 0.125 * self._qrs_peak + 0.875 * self._signal_level
+        if self._noise_count:
+            self._noise_level = 0.125 * self._noise_sum / self._noise_count + 0.875 * self._noise_level
+        self._noise_sum = 0.0
+        self._noise_count = 0
+        self._qrs_start = None
+        self._last_beat_index = peak_index
+        return peak_index
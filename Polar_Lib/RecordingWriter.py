@@ -0,0 +1,43 @@
+import contextlib
+import csv
+
+from .BackgroundWriter import BackgroundWriter
+from .BinaryRecording import BinaryRecordingWriter
+
+
+class BufferedCsvWriter(BackgroundWriter):
+    """ Append `timestamp,value` rows to a CSV file from a background thread.
+
+    The writer thread keeps the file open, batches pending rows and writes them once `flush_rows` rows are pending or
+    `flush_interval` seconds have passed since the last write (see `BackgroundWriter`). Multi-channel values
+    (n, channels) are written as `timestamp,v1,v2,...`; the sensor time given to `write()` is not kept, CSV rows
+    only hold host time.
+    """
+
+    def __init__(self, path: str, flush_rows: int = 4096, flush_interval: float = 1.0):
+        self.flush_rows = flush_rows
+        self._file = None
+        self._writer = None
+        super().__init__(path, flush_rows, flush_interval)
+
+    @contextlib.contextmanager
+    def _output(self):
+        with open(self.path, "a", newline="") as f:
+            self._file = f
+            self._writer = csv.writer(f)
+            yield
+
+    def _write_batches(self, pending):
+        for _, times, values in pending:
+            if values.ndim == 1:
+                self._writer.writerows(zip(times.tolist(), values.tolist()))
+            else:
+                self._writer.writerows(zip(times.tolist(), *values.T.tolist()))
+        self._file.flush()
+
+
+def open_writer(path: str, sampling_frequency: float = 130.0):
+    """ Background writer for a recording: chunked binary for `.h10` files, `timestamp,value` CSV otherwise. """
+    if path.endswith(".h10"):
+        return BinaryRecordingWriter(path, sampling_frequency)
+    return BufferedCsvWriter(path)
@@ -0,0 +1,16 @@
+class RestartPolicy:
+    """ Reconnection backoff applied when a connection ends without a stop request. """
+
+    def __init__(self, max_restarts: int = None, delay: float = 2.0, max_delay: float = 30.0, factor: float = 2.0):
+        # `max_restarts=None` retries forever.
+        self.max_restarts = max_restarts
+        self.delay = delay
+        self.max_delay = max_delay
+        self.factor = factor
+
+    def should_restart(self, restarts: int) -> bool:
+        return self.max_restarts is None or restarts <= self.max_restarts
+
+    def delay_for(self, restarts: int) -> float:
+        """ Delay before restart number `restarts` (1-based), growing geometrically up to `max_delay`. """
+        return min(self.max_delay, self.delay * self.factor ** (restarts - 1))
@@ -0,0 +1,132 @@
+import numpy as np
+
+
+class RingBuffer:
+    """ Fixed-capacity, NumPy-backed history of (timestamp, value) samples.
+
+    Every sample written is assigned a position in a monotonically increasing sequence (the write cursor). Readers
+    keep their own cursor and call `read_since` to fetch everything written after it, so several consumers can run
+    at different paces without the writer ever blocking or reallocating. Once more than `capacity` samples have been
+    written the oldest ones are overwritten; `oldest_cursor` tells a reader how far back data is still available.
+
+    Multi-channel streams (e.g. 3-axis accelerometer) pass `channels > 1`; values are then stored and returned as
+    (n, channels) arrays.
+    """
+
+    def __init__(self, capacity: int, dtype=np.float64, channels: int = 1):
+        if capacity <= 0:
+            raise ValueError("Capacity must be a positive integer.")
+        self._capacity = int(capacity)
+        self._times = np.zeros(self._capacity, dtype=np.float64)
+        self._values = np.zeros((self._capacity,) if channels == 1 else (self._capacity, channels), dtype=dtype)
+        self._cursor = 0
+        self._claimed = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def cursor(self) -> int:
+        """ Total number of samples written since creation. """
+        return self._cursor
+
+    @property
+    def oldest_cursor(self) -> int:
+        """ Cursor of the oldest sample still held in the buffer. """
+        return max(0, self._cursor - self._capacity)
+
+    def __len__(self):
+        return min(self._cursor, self._capacity)
+
+    def extend(self, times, values):
+        """ Append a batch of samples, overwriting the oldest ones when full. """
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=self._values.dtype)
+        n = len(values)
+        if n == 0:
+            return
+        end = self._cursor + n
+        # Claim the slots before touching them, so that readers copying them meanwhile drop what they copied.
+        self._claimed = end
+        if n > self._capacity:
+            # Only the tail of an oversized batch can be retained.
+            times = times[-self._capacity:]
+            values = values[-self._capacity:]
+            n = self._capacity
+
+        start = (end - n) % self._capacity
+        first = min(n, self._capacity - start)
+        self._times[start:start + first] = times[:first]
+        self._values[start:start + first] = values[:first]
+        if first < n:
+            self._times[:n - first] = times[first:]
+            self._values[:n - first] = values[first:]
+        self._cursor = end
+
+    def read_since(self, cursor: int):
+        """ Return (times, values, new_cursor) for every sample written after `cursor`.
+
+        If the reader fell behind by more than the capacity, reading resumes at `oldest_cursor`; the number of lost
+        samples is `oldest_cursor - cursor` when that is positive.
+        """
+        end = self._cursor
+        begin = max(cursor, end - self._capacity, 0)
+        times, values = self._read(begin, end)
+        return times, values, end
+
+    def window(self, t0: float, t1: float):
+        """ Return (times, values) of samples with t0 <= timestamp <= t1, assuming timestamps are non-decreasing. """
+        end = self._cursor
+        begin = max(0, end - self._capacity)
+        lo = hi = begin
+        for times in self._segments(begin, end):
+            lo += np.searchsorted(times, t0, side="left")
+            hi += np.searchsorted(times, t1, side="right")
+        return self._read(lo, hi)
+
+    def latest(self, n: int):
+        """ Return (times, values) of the `n` most recent samples. """
+        end = self._cursor
+        return self._read(max(0, end - self._capacity, end - n), end)
+
+    def clear(self):
+        self._cursor = 0
+        self._claimed = 0
+
+    def _slice(self, begin: int, end: int):
+        """ Copy the samples between two cursors, in chronological order. """
+        n = end - begin
+        if n <= 0:
+            return self._times[:0].copy(), self._values[:0].copy()
+        start = begin % self._capacity
+        stop = start + n
+        if stop <= self._capacity:
+            return self._times[start:stop].copy(), self._values[start:stop].copy()
+        stop -= self._capacity
+        return (np.concatenate((self._times[start:], self._times[:stop])),
+                np.concatenate((self._values[start:], self._values[:stop])))
+
+    def _read(self, begin: int, end: int):
+        """ Copy the samples between two cursors, minus any the writer overwrote while they were being copied.
+
+        Readers never lock out the writer: every read works on one snapshot of the write cursor, and samples whose
+        slots were reused during the copy (only possible at the oldest end of a full buffer) are dropped. `extend()`
+        claims its slots before writing them and publishes the cursor after, so slots being written when the copy
+        ends count as reused too.
+        """
+        times, values = self._slice(begin, end)
+        overwritten = self._claimed - self._capacity - begin
+        if overwritten > 0:
+            times, values = times[overwritten:], values[overwritten:]
+        return times, values
+
+    def _segments(self, begin: int, end: int):
+        """ Timestamps of cursors [begin, end) as at most two chronologically ordered views (no copy). """
+        if end - begin <= 0:
+            return []
+        start = begin % self._capacity
+        stop = start + (end - begin)
+        if stop <= self._capacity:
+            return [self._times[start:stop]]
+        return [self._times[start:], self._times[:stop - self._capacity]]
@@ -0,0 +1,161 @@
+import asyncio
+
+from .PolarLib import DeviceH10
+from .RestartPolicy import RestartPolicy
+
+
+class StrapStatus:
+    IDLE = "idle"
+    CONNECTING = "connecting"
+    STREAMING = "streaming"
+    RESTARTING = "restarting"
+    STOPPED = "stopped"
+    FAILED = "failed"
+
+
+class Strap:
+    """ One strap of a session: its device (and therefore its own buffers), status and restart policy. """
+
+    def __init__(self, device: DeviceH10, restart_policy: RestartPolicy):
+        self.device = device
+        self.restart_policy = restart_policy
+        self.restarts = 0
+        self._status = StrapStatus.IDLE
+
+    @property
+    def status(self) -> str:
+        if self._status == StrapStatus.CONNECTING:
+            if self.device.is_connected:
+                return StrapStatus.STREAMING
+            if self.device.is_reconnecting:
+                return StrapStatus.RESTARTING
+        return self._status
+
+
+class H10Session:
+    """ Drive several Polar H10 straps concurrently from a single asyncio event loop.
+
+    Each strap gets its own `DeviceH10`; `run()` supervises them all with one task per strap and returns once every
+    strap has stopped. Connection handshakes are serialized through a shared lock because most Bluetooth adapters
+    reject concurrent connection attempts, while streaming itself runs fully in parallel.
+    """
+
+    def __init__(self, mac_addresses=(), restart_policy: RestartPolicy = None, debug_mode: bool = False,
+                 buffer_seconds: float = 600.0, acc_sampling_frequency: int = None, client_factory=None):
+        self._restart_policy = restart_policy or RestartPolicy()
+        self._debug_mode = debug_mode
+        self._buffer_seconds = buffer_seconds
+        self._acc_sampling_frequency = acc_sampling_frequency
+        self._client_factory = client_factory
+        self._connect_lock = asyncio.Lock()
+        self._stop_event = asyncio.Event()
+        self._loop = None
+        self._running = False
+        self.straps = {}
+        for mac_address in mac_addresses:
+            self.add(mac_address)
+
+    @property
+    def devices(self) -> dict:
+        return {mac_address: strap.device for mac_address, strap in self.straps.items()}
+
+    def add(self, mac_address: str, restart_policy: RestartPolicy = None) -> DeviceH10:
+        """ Register a strap. Must be called before `run()`. """
+        if mac_address in self.straps:
+            raise ValueError("Device already in session: {0}".format(mac_address))
+        restart_policy = restart_policy or self._restart_policy
+        device = DeviceH10(mac_address, debug_mode=self._debug_mode, buffer_seconds=self._buffer_seconds,
+                           connect_lock=self._connect_lock, restart_policy=restart_policy,
+                           acc_sampling_frequency=self._acc_sampling_frequency,
+                           client_factory=self._client_factory, supervised=True)
+        self.straps[mac_address] = Strap(device, restart_policy)
+        return device
+
+    async def run(self):
+        """ Connect every strap and keep them streaming until `stop()` is called (at once if it already was). """
+        self._loop = asyncio.get_running_loop()
+        self._running = True
+        try:
+            await asyncio.gather(*(self._supervise(strap) for strap in self.straps.values()))
+        finally:
+            self._running = False
+            self._stop_event.clear()  # The stop request is consumed; a later run() streams again
+
+    def stop(self):
+        """ Request every strap to disconnect. Safe to call from another thread, also before `run()`. """
+        if not self._running:
+            # Nothing is connected yet: the next run() returns at once, without connecting any strap.
+            self._stop_event.set()
+            return
+        self._loop.call_soon_threadsafe(self._stop_event.set)
+        for strap in self.straps.values():
+            strap.device.stop()
+
+    async def _supervise(self, strap: Strap):
+        try:
+            await self._supervise_restarts(strap)
+        finally:
+            # The device keeps its streams open across the restarts below; they end with the supervision.
+            strap.device.close_streams()
+
+    async def _supervise_restarts(self, strap: Strap):
+        # Dropped BLE connections are retried by the device itself, which keeps its streams open and records the
+        # gap. Only errors escaping the device (e.g. the Bluetooth backend being unavailable) restart it from here,
+        # on the same streams, with the gap recorded as for a reconnection.
+        while not self._stop_event.is_set():
+            strap._status = StrapStatus.CONNECTING
+            try:
+                await strap.device.connect_async()
+            except Exception as ex:
+                print("{0}: {1}".format(strap.device.mac_address, ex))
+            else:
+                if not (self._stop_event.is_set() or strap.device.stop_requested):
+                    # The device exhausted its restart policy.
+                    strap._status = StrapStatus.FAILED
+                    return
+            if self._stop_event.is_set() or strap.device.stop_requested:
+                break
+
+            strap.restarts += 1
+            if not strap.restart_policy.should_restart(strap.restarts):
+                strap._status = StrapStatus.FAILED
+                return
+            strap._status = StrapStatus.RESTARTING
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), strap.restart_policy.delay_for(strap.restarts))
+            except asyncio.TimeoutError:
+                pass
+        strap._status = StrapStatus.STOPPED
+
+    def status(self) -> dict:
+        return {mac_address: strap.status for mac_address, strap in self.straps.items()}
+
+    def snapshot(self) -> dict:
+        """ Aggregated view of the latest values, keyed by device address. """
+        return {
+            mac_address: {
+                "status": strap.status,
+                "restarts": strap.restarts + strap.device.reconnects,
+                "gaps": len(strap.device.gaps),
+                "battery_level": strap.device.battery_level,
+                "hr": strap.device.last_hr_value,
+                "ibi": strap.device.last_ibi_value,
+                "ecg_samples": strap.device.ecg_buffer.cursor,
+                "ecg_beats": strap.device.rr_buffer.cursor,
+                "hrv": strap.device.hrv.metrics(),
+            }
+            for mac_address, strap in self.straps.items()
+        }
+
+    def read_since(self, name: str, cursors: dict) -> dict:
+        """ Catch up on stream `name` ("ecg", "acc", "hr", "ibi" or "rr") for every strap.
+
+        `cursors` maps device address to the reader's cursor (missing entries start from the oldest retained sample)
+        and is updated in place. Returns {address: (times, values)}.
+        """
+        result = {}
+        for mac_address, strap in self.straps.items():
+            buffer = getattr(strap.device, name + "_buffer")
+            times, values, cursors[mac_address] = buffer.read_since(cursors.get(mac_address, 0))
+            result[mac_address] = (times, values)
+        return result
@@ -0,0 +1,76 @@
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .RingBuffer import RingBuffer
+
+
+class SharedRingBuffer(RingBuffer):
+    """ `RingBuffer` whose samples and write cursor live in a `multiprocessing.shared_memory` block.
+
+    One process writes with `extend()`; any number of processes attached with `attach(**buffer.spec)` read with the
+    usual `read_since` / `window` / `latest`, straight from the shared block: nothing is pickled or sent through a
+    pipe. The writer claims slots before writing them and publishes the cursor only after the samples, and readers
+    drop samples in slots claimed while they were copied, so no locking is needed. The creating process should `unlink()` the block once every process has
+    `close()`d it.
+    """
+
+    def __init__(self, capacity: int, dtype=np.float64, channels: int = 1, name: str = None):
+        if capacity <= 0:
+            raise ValueError("Capacity must be a positive integer.")
+        self._capacity = int(capacity)
+        self._dtype = np.dtype(dtype)
+        self._channels = channels
+        shape = (self._capacity,) if channels == 1 else (self._capacity, channels)
+        values_size = self._dtype.itemsize * self._capacity * channels
+        size = 16 + 8 * self._capacity + values_size
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        elif sys.version_info >= (3, 13):
+            # Attaching must not register the block with this process' resource tracker, which would unlink it.
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        # Header: write cursor, then the end of the slots claimed by the write in progress
+        self._header = np.ndarray((2,), dtype=np.int64, buffer=self._shm.buf)
+        self._times = np.ndarray((self._capacity,), dtype=np.float64, buffer=self._shm.buf, offset=16)
+        self._values = np.ndarray(shape, dtype=self._dtype, buffer=self._shm.buf, offset=16 + 8 * self._capacity)
+        if name is None:
+            self._header[:] = 0
+
+    @classmethod
+    def attach(cls, name: str, capacity: int, dtype: str, channels: int = 1) -> "SharedRingBuffer":
+        """ Open a buffer created by another process, from its `spec`. """
+        return cls(capacity, dtype, channels, name=name)
+
+    @property
+    def spec(self) -> dict:
+        """ Picklable description from which another process can `attach` to this buffer. """
+        return {"name": self._shm.name, "capacity": self._capacity, "dtype": self._dtype.str,
+                "channels": self._channels}
+
+    @property
+    def _cursor(self) -> int:
+        return int(self._header[0])
+
+    @_cursor.setter
+    def _cursor(self, value: int):
+        self._header[0] = value
+
+    @property
+    def _claimed(self) -> int:
+        return int(self._header[1])
+
+    @_claimed.setter
+    def _claimed(self, value: int):
+        self._header[1] = value
+
+    def close(self):
+        """ Detach from the shared block (arrays read earlier are copies and stay valid). """
+        del self._header, self._times, self._values
+        self._shm.close()
+
+    def unlink(self):
+        """ Free the shared block; call once, from the creating process. """
+        self._shm.unlink()
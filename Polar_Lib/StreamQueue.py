@@ -0,0 +1,116 @@
+import asyncio
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+
+class StreamBatch(NamedTuple):
+    """ One notification worth of samples. """
+    times: np.ndarray
+    values: np.ndarray
+
+
+class OverflowPolicy:
+    """ What a subscription does when its consumer falls behind and the queue is full. """
+    # Discard the oldest queued batch to make room for the new one.
+    DROP_OLDEST = "drop_oldest"
+    # Wait for the consumer to make room (back-pressure onto the notification handler).
+    BLOCK = "block"
+    # Merge the whole backlog and the new batch into a single batch; nothing is lost.
+    COALESCE = "coalesce"
+
+    ALL = (DROP_OLDEST, BLOCK, COALESCE)
+
+
+class StreamSubscription:
+    """ Bounded queue of `StreamBatch` consumed with `async for batch in subscription`.
+
+    Iteration ends once the subscription is closed (by the consumer, or by the device when it disconnects) and every
+    batch queued before that has been delivered.
+    """
+
+    def __init__(self, maxsize: int = 64, overflow: str = OverflowPolicy.DROP_OLDEST, on_close=None,
+                 latency=None):
+        if overflow not in OverflowPolicy.ALL:
+            raise ValueError("Unknown overflow policy: {0}".format(overflow))
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._overflow = overflow
+        self._on_close = on_close
+        # Optional `Telemetry.Histogram` receiving the time each batch spent queued.
+        self._latency = latency
+        self._closed = False
+        # Set by close(), to release a producer waiting for room in a BLOCK queue
+        self._closed_event = asyncio.Event()
+        self.dropped_batches = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def put(self, batch: StreamBatch):
+        """ Queue a batch, applying the overflow policy. Only `BLOCK` can suspend the caller, until the consumer makes
+        room or the subscription is closed (the batch is then dropped and counted in `dropped_batches`). """
+        if self._closed:
+            return
+        item = (time.perf_counter(), batch)
+        if self._overflow == OverflowPolicy.BLOCK:
+            if not self._queue.full():
+                self._queue.put_nowait(item)
+                return
+            putter = asyncio.ensure_future(self._queue.put(item))
+            closed = asyncio.ensure_future(self._closed_event.wait())
+            try:
+                await asyncio.wait((putter, closed), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                closed.cancel()
+                queued = putter.done()
+                if not queued:
+                    putter.cancel()
+            if not queued:
+                # Closed while waiting: the consumer will not read this batch
+                self.dropped_batches += 1
+            return
+        if self._queue.full():
+            if self._overflow == OverflowPolicy.DROP_OLDEST:
+                self._queue.get_nowait()
+                self.dropped_batches += 1
+            else:
+                item = self._coalesce(batch)
+        self._queue.put_nowait(item)
+
+    def close(self):
+        """ Stop receiving; pending batches are still delivered to the iterator. """
+        if self._closed:
+            return
+        self._closed = True
+        self._closed_event.set()
+        if self._on_close is not None:
+            self._on_close(self)
+        if not self._queue.full():
+            # Wake up a consumer blocked on an empty queue.
+            self._queue.put_nowait(None)
+
+    def _coalesce(self, batch: StreamBatch):
+        pending = [self._queue.get_nowait() for _ in range(self._queue.qsize())]
+        batches = [b for _, b in pending] + [batch]
+        # The merged batch is as old as its oldest part.
+        return pending[0][0], StreamBatch(np.concatenate([b.times for b in batches]),
+                                          np.concatenate([b.values for b in batches]))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> StreamBatch:
+        if self._closed and self._queue.empty():
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        enqueued_at, batch = item
+        if self._latency is not None:
+            self._latency.record(time.perf_counter() - enqueued_at)
+        return batch
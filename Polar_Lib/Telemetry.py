@@ -0,0 +1,169 @@
+import asyncio
+import collections
+import json
+import math
+import time
+
+
+class Histogram:
+    """ Log-bucketed histogram of durations (seconds) with O(1) recording.
+
+    Buckets are `buckets_per_decade` per power of ten between `min_value` and `max_value`, plus an underflow and an
+    overflow bucket, so percentiles are accurate to about one bucket width (~26 % with the default 10 per decade).
+    """
+
+    def __init__(self, min_value: float = 1e-6, max_value: float = 10.0, buckets_per_decade: int = 10):
+        self._min_value = min_value
+        self._log_min = math.log10(min_value)
+        self._buckets_per_decade = buckets_per_decade
+        self.counts = [0] * (int(math.ceil(math.log10(max_value / min_value) * buckets_per_decade)) + 2)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float):
+        if value <= self._min_value:
+            index = 0
+        else:
+            index = min(len(self.counts) - 1,
+                        1 + int((math.log10(value) - self._log_min) * self._buckets_per_decade))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def _upper_edge(self, index: int) -> float:
+        return 10.0 ** (self._log_min + index / self._buckets_per_decade)
+
+    def percentile(self, p: float) -> float:
+        """ Upper edge of the bucket holding the p-th percentile (0-100). """
+        if self.count == 0:
+            return math.nan
+        rank = p / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self._upper_edge(index), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else math.nan,
+                "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99),
+                "max": self.max}
+
+
+class StreamStats:
+    """ Counters and timing histograms of one data stream. """
+
+    RATE_WINDOW = 5.0  # seconds over which packets/s and samples/s are measured
+
+    def __init__(self):
+        self.packets = 0
+        self.samples = 0
+        self.samples_lost = 0
+        self.gaps = 0
+        self.decode = Histogram()  # frame decode time
+        self.handler = Histogram()  # whole notification handler, decode to publish
+        self.callback = Histogram()  # time spent in `received_data_cb`
+        self.queue = Histogram()  # delay between publishing a batch and a subscriber taking it
+        self._first_packet = None
+        self._window = collections.deque()  # (time, samples) of the packets of the last RATE_WINDOW seconds
+
+    def record_packet(self, n_samples: int, now: float = None):
+        now = time.perf_counter() if now is None else now
+        self.packets += 1
+        self.samples += n_samples
+        if self._first_packet is None:
+            self._first_packet = now
+        self._window.append((now, n_samples))
+        self._expire(now)
+
+    def _expire(self, now: float):
+        while self._window and self._window[0][0] < now - self.RATE_WINDOW:
+            self._window.popleft()
+
+    def rates(self, now: float = None):
+        """ (packets/s, samples/s) over the last RATE_WINDOW seconds, as of `now`: they fall to 0 when the stream
+        stalls. A stream younger than the window is measured from its first packet. """
+        now = time.perf_counter() if now is None else now
+        self._expire(now)
+        if self._first_packet is None:
+            return 0.0, 0.0
+        packets, samples = len(self._window), sum(n for _, n in self._window)
+        elapsed = now - self._first_packet
+        if elapsed < self.RATE_WINDOW:
+            # The first packet only starts the measurement
+            packets, samples = packets - 1, samples - self._window[0][1]
+            if elapsed <= 0 or packets <= 0:
+                return 0.0, 0.0
+            return packets / elapsed, samples / elapsed
+        return packets / self.RATE_WINDOW, samples / self.RATE_WINDOW
+
+    @property
+    def packets_per_s(self) -> float:
+        return self.rates()[0]
+
+    @property
+    def samples_per_s(self) -> float:
+        return self.rates()[1]
+
+    def record_gap(self, samples_lost):
+        self.gaps += 1
+        if samples_lost:
+            self.samples_lost += samples_lost
+
+    def snapshot(self) -> dict:
+        packets_per_s, samples_per_s = self.rates()
+        return {"packets": self.packets, "samples": self.samples,
+                "packets_per_s": packets_per_s, "samples_per_s": samples_per_s,
+                "samples_lost": self.samples_lost, "gaps": self.gaps,
+                "decode": self.decode.summary(), "handler": self.handler.summary(),
+                "callback": self.callback.summary(), "queue": self.queue.summary()}
+
+
+class Telemetry:
+    """ Acquisition health of one device: per-stream statistics plus event-loop lag.
+
+    Query with `snapshot()`, or append snapshots to a JSON-lines file with `dump()` / `dump_periodically()`.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.streams = {}
+        self.loop_lag = Histogram()
+
+    def stream(self, name: str) -> StreamStats:
+        stats = self.streams.get(name)
+        if stats is None:
+            stats = self.streams[name] = StreamStats()
+        return stats
+
+    def snapshot(self) -> dict:
+        return {"time": time.time(), "uptime": time.time() - self.started,
+                "loop_lag": self.loop_lag.summary(),
+                "streams": {name: stats.snapshot() for name, stats in self.streams.items()}}
+
+    def dump(self, path: str, **extra):
+        """ Append one snapshot (plus `extra` fields) as a JSON line. """
+        record = dict(extra, **self.snapshot())
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    async def dump_periodically(self, path: str, interval: float = 10.0, **extra):
+        """ Call `dump` every `interval` seconds until cancelled; a final snapshot is written on cancellation. """
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                self.dump(path, **extra)
+        finally:
+            self.dump(path, **extra)
+
+    async def monitor_loop(self, interval: float = 0.1):
+        """ Measure how late the event loop wakes up a sleeping task, until cancelled. """
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.record(max(0.0, time.perf_counter() - start - interval))
@@ -0,0 +1,88 @@
+import numpy as np
+
+from .Decimation import MinMaxPyramid
+
+
+class TraceViewer:
+    """ Long time series on a matplotlib Axes, redrawn at the level of detail of the current view.
+
+    Each trace gets a `MinMaxPyramid` and one persistent line: whenever the x limits change (toolbar zoom or pan,
+    `set_window()`, resizing) only the data of the lines is replaced, by the pyramid level that gives two points per
+    pixel column for the visible window, so the cost of a redraw does not depend on the length of the recording. Markers
+    (detected peaks...) are kept sorted and sliced with `searchsorted`. Hidden traces keep their line and are skipped.
+    """
+
+    def __init__(self, ax):
+        self.ax = ax
+        self.traces = {}  # name: (MinMaxPyramid, Line2D)
+        self.markers = {}  # name: (times, values, Line2D)
+        ax.callbacks.connect("xlim_changed", lambda _: self.refresh())
+        ax.figure.canvas.mpl_connect("resize_event", lambda _: self.refresh())
+
+    def add_trace(self, name: str, times, values, **line_kwargs):
+        """ Plot a trace (times sorted); keyword arguments go to `Axes.plot`. Returns its line. """
+        line_kwargs.setdefault("label", name)
+        line, = self.ax.plot([], [], **line_kwargs)
+        self.traces[name] = (MinMaxPyramid(times, values), line)
+        return line
+
+    def add_markers(self, name: str, times, values, **line_kwargs):
+        """ Plot points such as detected peaks (drawn as "o" unless `marker` is given). Returns their line. """
+        line_kwargs.setdefault("label", name)
+        line_kwargs.setdefault("linestyle", "none")
+        line_kwargs.setdefault("marker", "o")
+        times = np.asarray(times)
+        order = np.argsort(times, kind="stable")
+        line, = self.ax.plot([], [], **line_kwargs)
+        self.markers[name] = (times[order], np.asarray(values)[order], line)
+        return line
+
+    def set_visible(self, name: str, visible: bool):
+        """ Show or hide a trace or markers, without re-plotting anything. """
+        line = self.traces[name][1] if name in self.traces else self.markers[name][2]
+        line.set_visible(visible)
+        self.refresh()
+        self.ax.figure.canvas.draw_idle()
+
+    @property
+    def time_range(self):
+        """ (first, last) time over every trace. """
+        bounds = [(pyramid.levels[0][0][0], pyramid.levels[0][0][-1]) for pyramid, _ in self.traces.values()
+                  if len(pyramid)]
+        if not bounds:
+            return 0.0, 1.0
+        return min(first for first, _ in bounds), max(last for _, last in bounds)
+
+    def set_window(self, start: float, end: float):
+        """ Show [start, end] (the lines follow through the x limits callback). """
+        self.ax.set_xlim(start, end)
+        self.ax.figure.canvas.draw_idle()
+
+    def show_all(self):
+        """ Fit the axes to the whole of the visible traces. """
+        self.autoscale_y()
+        start, end = self.time_range
+        self.set_window(start, end if end > start else start + 1.0)
+
+    def autoscale_y(self, margin: float = 0.05):
+        """ Y limits around the whole of the visible traces. """
+        limits = [pyramid.limits for pyramid, line in self.traces.values() if line.get_visible() and len(pyramid)]
+        if not limits:
+            return
+        low, high = min(low for low, _ in limits), max(high for _, high in limits)
+        pad = margin * (high - low) or 1.0
+        self.ax.set_ylim(low - pad, high + pad)
+
+    def refresh(self):
+        """ Give every visible line the data for the current x limits. """
+        start, end = self.ax.get_xlim()
+        columns = max(1, int(self.ax.bbox.width))
+        for pyramid, line in self.traces.values():
+            if line.get_visible():
+                line.set_data(*pyramid.view(start, end, columns))
+        for times, values, line in self.markers.values():
+            if line.get_visible():
+                first, last = np.searchsorted(times, [start, end])
+                # Thinned out when zoomed so far out that they would only draw as a solid band
+                step = (last - first) // (2 * columns) + 1
+                line.set_data(times[first:last:step], values[first:last:step])
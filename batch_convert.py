@@ -0,0 +1,125 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Polar_Lib.Converters import CONVERT_STATUS, CONVERTERS, MissingColumnsError, convert_cached
+
+# Headless batch version of ecg_extract.py, polar_extract.py and keplr_extract.py: the same conversions, for every
+# export of a study, spread over a pool of worker processes. Outputs are written next to each export, with the same
+# names as the GUI tools give them. Exports that did not change since their last conversion are skipped, and only the
+# rows appended to a growing one are converted (see Polar_Lib/ConversionCache.py); --force converts everything again.
+#
+#   python batch_convert.py ./study                       every *.csv of the directory, all applicable conversions
+#   python batch_convert.py "./study/*/session_*.csv" --convert polar --jobs 4
+#   python batch_convert.py ./study --recursive
+#
+# A file that fails is reported and the batch goes on; the exit status is 1 if any conversion failed.
+
+# Files written by the conversions themselves, never taken as inputs.
+OUTPUT_SUFFIXES = ("_ecg.csv", "_polar.csv", "_keplr.csv", "_keplr_processed.csv")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert sensor exports to _ecg / _polar / _keplr CSV files.")
+    parser.add_argument("inputs", nargs="+", help="export files, directories or glob patterns")
+    parser.add_argument("-c", "--convert", action="append", choices=sorted(CONVERTERS),
+                        help="conversion to run; repeat for several (default: every one whose columns the export "
+                             "has)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="also search subdirectories")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="convert again even the exports whose outputs are up to date")
+    return parser.parse_args(argv)
+
+
+def find_exports(inputs, recursive=False) -> list:
+    """ Export paths named by files, directories and glob patterns, without duplicates or conversion outputs. """
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*.csv") if recursive else os.path.join(pattern, "*.csv")
+        if not glob.has_magic(pattern):
+            pattern = glob.escape(pattern)  # a plain path: matches itself if it exists
+        matches = glob.glob(pattern, recursive=recursive)
+        if not matches:
+            print("No file matches {0}".format(pattern))
+        paths.extend(os.path.normpath(path) for path in sorted(matches) if os.path.isfile(path))
+    paths = [path for path in dict.fromkeys(paths) if not path.endswith(OUTPUT_SUFFIXES)]
+    # Largest first, so a big file started last does not leave every other worker idle at the end.
+    return sorted(paths, key=os.path.getsize, reverse=True)
+
+
+def convert_file(path, names=None, force=False) -> list:
+    """ Run conversions on one export, in a worker process. Returns one (name, status, seconds, detail) per
+    conversion, status being "ok", "skipped" or "failed"; nothing is raised, so one bad file cannot stop a batch. """
+    results = []
+    for name in names or CONVERTERS:
+        start = time.perf_counter()
+        try:
+            outputs, how = convert_cached(name, path, force)
+        except MissingColumnsError as e:
+            # Without --convert, conversions that do not apply to this export are simply not run.
+            results.append((name, "skipped" if names is None else "failed", time.perf_counter() - start, str(e)))
+        except Exception as e:
+            results.append((name, "failed", time.perf_counter() - start, "{0}: {1}".format(type(e).__name__, e)))
+        else:
+            results.append((name, "ok", time.perf_counter() - start,
+                            "{0}: {1}".format(CONVERT_STATUS[how], ", ".join(outputs))))
+    return results
+
+
+def report(index, total, path, results):
+    print("[{0}/{1}] {2}".format(index, total, path))
+    for name, status, seconds, detail in results:
+        if status == "ok":
+            print("    {0}: {1:.2f} s, {2}".format(name, seconds, detail))
+        elif status == "failed":
+            print("    {0}: FAILED after {1:.2f} s: {2}".format(name, seconds, detail))
+    if all(status == "skipped" for _, status, _, _ in results):
+        print("    no conversion applies")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    paths = find_exports(args.inputs, args.recursive)
+    if not paths:
+        print("No export to convert.")
+        return 1
+    jobs = max(1, min(args.jobs or 1, len(paths)))
+    print("Converting {0} file(s) with {1} worker(s)".format(len(paths), jobs))
+
+    start = time.perf_counter()
+    counts = {"ok": 0, "skipped": 0, "failed": 0}
+    failed_files = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(convert_file, path, args.convert, args.force): path for path in paths}
+        try:
+            for index, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:  # The worker itself died (out of memory, killed...)
+                    results = [("worker", "failed", 0.0, "{0}: {1}".format(type(e).__name__, e))]
+                report(index, len(paths), path, results)
+                for _, status, _, _ in results:
+                    counts[status] += 1
+                if any(status == "failed" for _, status, _, _ in results):
+                    failed_files.append(path)
+        except KeyboardInterrupt:
+            print("Interrupted, cancelling the remaining files")
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    print("Done in {0:.1f} s: {1} conversion(s) up to date, {2} failed, {3} not applicable".format(
+        time.perf_counter() - start, counts["ok"], counts["failed"], counts["skipped"]))
+    for path in failed_files:
+        print("Failed: {0}".format(path))
+    return 1 if failed_files else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
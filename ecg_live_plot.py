@@ -2,42 +2,67 @@ import tkinter as tk
 from tkinter import filedialog
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-import csv
 import os
 import time
 import threading
-import sys
+import argparse
 import asyncio
+import numpy as np
 
 # # Dynamically add the Polar_Lib directory to the Python path
 # current_dir = os.path.dirname(os.path.abspath(__file__))
 # polar_lib_path = os.path.join(current_dir, '../cta_das_library/Polar_Lib')
 # sys.path.append(os.path.normpath(polar_lib_path))
 
+from Polar_Lib.AcquisitionProcess import AcquisitionProcess
+from Polar_Lib.Decimation import AutoScale, minmax_envelope
+from Polar_Lib.LiveFeed import LiveFeed
 from Polar_Lib.PolarLib import DeviceH10
+from Polar_Lib.RecordingWriter import open_writer
+from Polar_Lib.RestartPolicy import RestartPolicy
+
+DEFAULT_MAC_ADDRESS = "D1:A8:FA:9E:2B:A8"
+# Longest window the plot can show; older samples are dropped from the plot buffer (not from the recording).
+MAX_PLOT_SECONDS = 600
+# Plot refresh rate. Only the traces are redrawn each frame (blitting); axes and ticks only when the limits change.
+REFRESH_FPS = 25
+# Longest wait for the strap to disconnect after Stop; a timeout is reported like any other disconnect error.
+STOP_TIMEOUT = 5.0
 
 class ECGApp:
-    def __init__(self, root):
+    def __init__(self, root, mac_address=DEFAULT_MAC_ADDRESS, isolated=False):
         self.root = root
         self.root.title("ECG Live Plot")
 
+        self.mac_address = mac_address
+        # Run the strap and the recording in a separate process (see Polar_Lib.AcquisitionProcess).
+        self.isolated = isolated
+
         self.device = None
+        self.acquisition = None
         self.filepath = None
         self.is_running = False
-        self.ecg_data = []
-        self.ecg_timestamps = []
+        # Fixed-capacity, time-indexed plot history (ECG, HR, HRV, detected beats), filled by `self.feed` from the
+        # BLE thread (or the acquisition process) and windowed from the Tk thread.
+        self.feed = None
+        self.plot_lock = threading.Lock()
+        self.refresh_job = None
+        self.background = None
         self.n_seconds = 10
         self.battery_level = tk.StringVar(value="Battery: N/A")
         self.current_hr = tk.StringVar(value="HR: N/A")
         self.error_message = tk.StringVar(value="")
+        self.acquisition_status = tk.StringVar(value="")
+        self.telemetry_future = None
+        self.is_closing = False
+        self.recording_closed = None  # Set once the recording of the last stop() is closed
 
         self.create_widgets()
         self.create_plot()
 
     def create_widgets(self):
         # Adjust the layout to make the top section centered and less cramped
-        self.top_frame = tk.Frame(self.root, height=150, width=400)
+        self.top_frame = tk.Frame(self.root, height=170, width=520)
         self.top_frame.grid(row=0, column=0, sticky="n")
         self.top_frame.grid_propagate(False)
         self.top_frame.pack_propagate(False)
@@ -68,21 +93,37 @@ class ECGApp:
         tk.Label(self.top_frame, textvariable=self.battery_level).grid(row=4, column=0, columnspan=2)
         tk.Label(self.top_frame, textvariable=self.current_hr).grid(row=5, column=0, columnspan=2)
         tk.Label(self.top_frame, textvariable=self.error_message, fg="red").grid(row=6, column=0, columnspan=2)
+        tk.Label(self.top_frame, textvariable=self.acquisition_status).grid(row=7, column=0, columnspan=2)
 
     def create_plot(self):
-        self.fig, self.ax = plt.subplots()
-        self.line, = self.ax.plot([], [], lw=2)
-        self.ax.set_xlim(0, self.n_seconds)
+        self.fig, (self.ax, self.hr_ax, self.hrv_ax) = plt.subplots(3, 1, sharex=True,
+                                                                   gridspec_kw={"height_ratios": (3, 1, 1)})
+        # Animated lines are left out of normal draws and blitted over a cached background instead.
+        self.line, = self.ax.plot([], [], lw=1, animated=True)
+        self.hr_line, = self.hr_ax.plot([], [], lw=1.5, color="tab:red", animated=True)
+        self.hrv_line, = self.hrv_ax.plot([], [], lw=1.5, color="tab:green", animated=True)
+        self.beat_markers, = self.ax.plot([], [], "o", ms=4, color="tab:red", animated=True)
+        self.traces = [(self.line, "ecg", AutoScale()),
+                       (self.hr_line, "hr", AutoScale()),
+                       (self.hrv_line, "hrv", AutoScale())]
+        self.ax.set_xlim(-self.n_seconds, 0)
         self.ax.set_ylim(-500, 500)
+        self.hr_ax.set_ylim(40, 180)
+        self.hrv_ax.set_ylim(0, 100)
         self.ax.set_title("ECG Live Plot")
-        self.ax.set_xlabel("Time (s)")
         self.ax.set_ylabel("ECG Value")
+        self.hr_ax.set_ylabel("HR (bpm)")
+        self.hrv_ax.set_ylabel("RMSSD (ms)")
+        self.hrv_ax.set_xlabel("Time (s)")
 
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.plot_frame)
         self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        # Every full draw (first show, resize, new limits) refreshes the cached background.
+        self.canvas.mpl_connect("draw_event", self.on_draw)
 
     def select_file(self):
-        self.filepath = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        self.filepath = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[
+            ("CSV files", "*.csv"), ("H10 recordings", "*.h10"), ("All files", "*.*")])
         if not os.path.exists(self.filepath):
             timestamp = time.strftime("_%Y%m%d_%H%M%S")
             base, ext = os.path.splitext(self.filepath)
@@ -105,13 +146,29 @@ class ECGApp:
         self.error_message.set("")  # Clear any previous error messages
 
         try:
-            self.device = DeviceH10("D1:A8:FA:9E:2B:A8", debug_mode=True)
-            self.device.received_data_cb = self.process_data
-
-            # Schedule the connect_device coroutine in the event loop
-            asyncio.run_coroutine_threadsafe(self.connect_device(), self.loop)
-
-            self.ani = FuncAnimation(self.fig, self.update_plot, interval=1000, cache_frame_data=False)
+            for _, _, autoscale in self.traces:
+                autoscale.reset()
+            if self.isolated:
+                self.acquisition = AcquisitionProcess(self.mac_address, self.filepath, MAX_PLOT_SECONDS)
+                self.feed = self.acquisition.feed
+                self.acquisition.start()
+            else:
+                self.device = DeviceH10(self.mac_address, restart_policy=RestartPolicy())
+                # Rows are written by a background thread so disk stalls never hold up BLE handling.
+                # CSV unless a .h10 file was chosen: chunked binary, convert with `python -m Polar_Lib.BinaryRecording`.
+                writer = open_writer(self.filepath, DeviceH10.ECG_SAMPLING_FREQUENCY)
+                self.feed = LiveFeed(LiveFeed.create_buffers(MAX_PLOT_SECONDS), writer, lock=self.plot_lock)
+                self.device.received_data_cb = self.process_data
+
+                # Schedule the connect_device coroutine in the event loop
+                asyncio.run_coroutine_threadsafe(self.connect_device(), self.loop)
+                # Acquisition health (packet rates, losses, timings) is appended next to the recording every 10 s.
+                telemetry_path = os.path.splitext(self.filepath)[0] + "_telemetry.jsonl"
+                self.telemetry_future = asyncio.run_coroutine_threadsafe(
+                    self.device.telemetry.dump_periodically(telemetry_path, mac_address=self.mac_address), self.loop)
+
+            if self.refresh_job is None:
+                self.update_plot()
         except Exception as e:
             self.is_running = False
             self.error_message.set(f"Error: {str(e)}")
@@ -119,53 +176,133 @@ class ECGApp:
 
     def stop(self):
         self.is_running = False
+        if self.telemetry_future is not None:
+            self.telemetry_future.cancel()
+            self.telemetry_future = None
+        writer = self.feed.writer if self.feed is not None else None
         if self.device:
-            self.device.stop()
-        if hasattr(self, 'thread') and self.thread.is_alive():
-            self.thread.join(timeout=1)  # Ensure the thread stops within a timeout
+            # The device disconnects on the asyncio thread; Start is re-enabled once it has, without blocking the GUI.
+            # The recording stays attached until then, as the feed may still be writing to it from that thread.
+            self.start_button.config(state=tk.DISABLED)
+            self.recording_closed = threading.Event()
+            closed = self.recording_closed
+            stopped = asyncio.run_coroutine_threadsafe(asyncio.wait_for(self.device.stop_async(), STOP_TIMEOUT),
+                                                       self.loop)
+            stopped.add_done_callback(lambda future: self.on_device_stopped(future, writer, closed))
+        elif writer is not None:
+            writer.close()
 
         self.device = None  # Explicitly set the device to None to release resources
 
-        # Stop the animation if it exists
-        if hasattr(self, 'ani') and self.ani:
-            self.ani.event_source.stop()
-            self.ani = None
+        # Stop the plot refresh if it is running
+        if self.refresh_job is not None:
+            self.root.after_cancel(self.refresh_job)
+            self.refresh_job = None
+
+        if self.acquisition is not None:
+            self.acquisition.stop()  # Closes the recording in the acquisition process, then frees the buffers
+            self.acquisition = None
+            self.feed = None
+
+    def on_device_stopped(self, future, writer, closed):
+        # Called on the asyncio thread, once the feed can no longer be called: the recording is closed here (which
+        # flushes whatever is still pending), the outcome is handled on the Tk thread (unless the window is gone).
+        if writer is not None:
+            writer.close()
+        closed.set()
+        if not self.is_closing:
+            self.root.after(0, self.on_stopped, future)
+
+    def on_stopped(self, future):
+        try:
+            future.result()
+        except Exception as e:
+            print("Disconnect failed: {0!r}".format(e))
+            self.error_message.set(f"Error: disconnect failed: {e!r}")
+        self.start_button.config(state=tk.NORMAL)
 
     def process_data(self, device):
-        if not self.is_running:
-            return
-
-        self.ecg_data.extend(device.last_ecg_values)
-        self.ecg_timestamps.extend(device.ecg_stream_times)
+        if self.is_running:
+            self.feed(device)
 
-        with open(self.filepath, "a", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            for timestamp, value in zip(device.ecg_stream_times, device.last_ecg_values):
-                writer.writerow([timestamp, value])
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_traces()
 
-        self.battery_level.set(f"Battery: {device.battery_level}%")
-        self.current_hr.set(f"HR: {device.last_hr_value}")
+    def draw_traces(self):
+        for line, _, _ in self.traces:
+            line.axes.draw_artist(line)
+        self.ax.draw_artist(self.beat_markers)
 
-    def update_plot(self, frame):
+    def update_plot(self):
+        self.refresh_job = self.root.after(1000 // REFRESH_FPS, self.update_plot)
         try:
-            self.n_seconds = int(self.n_seconds_entry.get())
+            n_seconds = min(int(self.n_seconds_entry.get()), MAX_PLOT_SECONDS)
         except ValueError:
-            self.n_seconds = 10
-
+            n_seconds = 10
+        redraw = self.background is None
+        if n_seconds != self.n_seconds:
+            self.n_seconds = n_seconds
+            self.ax.set_xlim(-n_seconds, 0)
+            redraw = True
+
+        # Binary search for the window: the cost depends on the window length, not on the session length.
         current_time = time.time()
-        filtered_data = [(t, v) for t, v in zip(self.ecg_timestamps, self.ecg_data) if current_time - t <= self.n_seconds]
-
-        if filtered_data:
-            times, values = zip(*filtered_data)
-            self.line.set_data(times, values)
-            self.ax.set_xlim(min(times), max(times))
-            self.ax.set_ylim(min(values), max(values))
-
-        self.canvas.draw()
-        return self.line,
+        buffers = self.feed.buffers
+        with self.plot_lock:
+            windows = [buffers[name].window(current_time - n_seconds, current_time) for _, name, _ in self.traces]
+            beat_times, _ = buffers["rr"].window(current_time - n_seconds, current_time)
+
+        # Markers sit on the full-resolution ECG, before it is decimated for drawing.
+        ecg_times, ecg_values = windows[0]
+        if len(ecg_times):
+            self.beat_markers.set_data(beat_times - current_time, np.interp(beat_times, ecg_times, ecg_values))
+        else:
+            self.beat_markers.set_data([], [])
+
+        # One min/max pair per pixel column looks identical to the full trace and bounds the cost of drawing it.
+        width = int(self.ax.bbox.width)
+        for (line, _, autoscale), (times, values) in zip(self.traces, windows):
+            times, values = minmax_envelope(times, values, width)
+            # Time axis is relative to now, so the x limits stay fixed while the traces scroll.
+            line.set_data(times - current_time, values)
+            if len(values):
+                limits = autoscale.update(values.min(), values.max())
+                if limits is not None:
+                    line.axes.set_ylim(*limits)
+                    redraw = True
+
+        self.show_status()
+
+        if redraw:
+            self.canvas.draw()  # Redraws axes and ticks; `on_draw` caches the new background and adds the traces
+        else:
+            self.canvas.restore_region(self.background)
+            self.draw_traces()
+            self.canvas.blit(self.fig.bbox)
+
+    def show_status(self):
+        def show(field, fmt="{0:.0f}"):
+            value = self.feed.get(field)
+            return "N/A" if value is None else fmt.format(value)
+
+        self.battery_level.set(f"Battery: {show('battery_level')}%")
+        self.current_hr.set(f"HR: {show('hr')}")
+        # ECG-derived RR next to the strap's own IBI: they should agree within a few ms on clean signal.
+        self.acquisition_status.set(f"ECG: {show('packets_per_s', '{0:.1f}')} packets/s, "
+                                    f"{show('samples_lost')} samples lost | "
+                                    f"RR (ECG): {show('rr')} ms, IBI (strap): {show('ibi')} ms")
+        if self.acquisition is not None:
+            error = self.acquisition.poll_error()
+            if error is not None:
+                self.error_message.set(f"Error: {error}")
 
     def on_closing(self):
+        self.is_closing = True
         self.stop()  # Ensure the script stops when the window is closed
+        if self.recording_closed is not None:
+            # The asyncio thread dies with the window: let it finish the recording first
+            self.recording_closed.wait(STOP_TIMEOUT + 1.0)
         self.root.destroy()
 
     def run_asyncio_loop(self):
@@ -176,8 +313,14 @@ class ECGApp:
 
 # Update the main block to integrate asyncio with Tkinter
 if __name__ == "__main__":
+    # The strap address can be given on the command line: python ecg_live_plot.py D1:A8:FA:9E:2B:A8 [--isolated]
+    parser = argparse.ArgumentParser(description="Plot and record the ECG of a Polar H10.")
+    parser.add_argument("address", nargs="?", default=DEFAULT_MAC_ADDRESS, help="MAC address of the strap")
+    parser.add_argument("--isolated", action="store_true",
+                        help="acquire and record in a separate process, so the GUI can never stall BLE handling")
+    args = parser.parse_args()
     root = tk.Tk()
-    app = ECGApp(root)
+    app = ECGApp(root, args.address, args.isolated)
 
     # Start the asyncio event loop in a separate thread
     threading.Thread(target=app.run_asyncio_loop, daemon=True).start()
@@ -0,0 +1,168 @@
+import time
+
+_START = time.perf_counter()  # before any other import, so the startup report includes import time
+
+import argparse
+import asyncio
+import os
+import signal
+
+from Polar_Lib.PolarLib import DeviceH10
+from Polar_Lib.RecordingWriter import BufferedCsvWriter
+from Polar_Lib.RestartPolicy import RestartPolicy
+from Polar_Lib.Session import H10Session
+from Polar_Lib.StreamQueue import OverflowPolicy
+
+# Headless recorder: no tkinter / matplotlib / pandas, so it starts fast and runs over SSH or on small lab machines.
+# Each stream goes to its own CSV of `timestamp,value` rows (no header, like ecg_live_plot.py; ACC rows are
+# `timestamp,x,y,z`). Timestamps are host time in seconds (time.time()).
+#
+#   python ecg_record.py D1:A8:FA:9E:2B:A8 --duration 600 --hr
+#   python ecg_record.py --replay synthetic --speed 10 --startup-report
+#   python ecg_record.py D1:A8:FA:9E:2B:A8 -o session.csv --log-packets   # then: --replay session_packets.jsonl
+#
+# Import-time regressions can be tracked with `python -X importtime ecg_record.py --help` or `--startup-report`.
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Record Polar H10 streams to CSV without a GUI.")
+    parser.add_argument("addresses", nargs="*", help="MAC address of each strap")
+    parser.add_argument("-o", "--output", help="ECG output file (default ./data/ecg_raw_<time>.csv); other streams "
+                                               "and straps get a suffix")
+    parser.add_argument("-d", "--duration", type=float, help="stop after this many seconds (default: until Ctrl-C)")
+    parser.add_argument("--acc", type=int, choices=DeviceH10.ACC_SAMPLING_FREQUENCIES,
+                        help="also record accelerometer data at this rate (Hz)")
+    parser.add_argument("--hr", action="store_true", help="also record HR, IBI and the RR intervals detected in "
+                                                          "the ECG")
+    parser.add_argument("--telemetry", type=float, default=10.0, metavar="SECONDS",
+                        help="telemetry dump interval; 0 disables (default: 10)")
+    parser.add_argument("--replay", metavar="FILE", help="replay a packet recording (or 'synthetic') instead of "
+                                                         "connecting to straps")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed; 0 = as fast as possible")
+    parser.add_argument("--log-packets", action="store_true",
+                        help="also write the raw BLE notifications of each strap to <output>_packets.jsonl, "
+                             "which --replay plays back")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print import and first-sample times")
+    args = parser.parse_args(argv)
+    if not args.addresses and not args.replay:
+        parser.error("give at least one strap address, or --replay")
+    return args
+
+
+def output_paths(args, address):
+    """ {stream: path} for one strap. """
+    output = args.output or "./data/ecg_raw_{0}.csv".format(time.strftime("%Y%m%d_%H%M%S"))
+    base, ext = os.path.splitext(output)
+    if len(args.addresses) > 1:
+        base += "_" + address.replace(":", "")
+    streams = ["ecg"] + (["acc"] if args.acc else []) + (["hr", "ibi", "rr"] if args.hr else [])
+    return {stream: (base + ext if stream == "ecg" else "{0}_{1}{2}".format(base, stream, ext)) for stream in streams}
+
+
+async def write_stream(subscription, path, first_sample=None):
+    """ Append every batch of a subscription to a CSV file until the stream ends. """
+    writer = BufferedCsvWriter(path)
+    try:
+        async for batch in subscription:
+            if first_sample is not None and not first_sample.done():
+                first_sample.set_result(time.perf_counter())
+            writer.write(batch.times, batch.values)
+    finally:
+        # Joining the writer thread can take a disk flush; keep the event loop free meanwhile.
+        await asyncio.get_running_loop().run_in_executor(None, writer.close)
+
+
+def client_factory(args, finished_callback=None, packet_logs=None):
+    """ BLE backend: real straps unless --replay asks for recorded or synthetic packets (`finished_callback(client)`
+    is then called when a replay runs out of packets). With `packet_logs` ({address: PacketLog}) every notification
+    is also logged. """
+    if not args.replay and not packet_logs:
+        return None
+    # Only needed for replays and packet logs, so only imported for them.
+    from Polar_Lib.FakeClient import FakeBleakClient, LoggingBleakClient, load_packets, synthetic_packets
+    factory = None
+    if args.replay:
+        if args.replay == "synthetic":
+            packets = synthetic_packets(args.duration or 60.0, acc_sampling_frequency=args.acc)
+        else:
+            packets = load_packets(args.replay)
+        factory = FakeBleakClient.factory(packets, speed=args.speed or None, finished_callback=finished_callback)
+    if packet_logs:
+        factory = LoggingBleakClient.factory(packet_logs, factory)
+    return factory
+
+
+async def record(args):
+    addresses = args.addresses or ["00:00:00:00:00:00"]
+    # A replay ends when its packets run out; only real straps are reconnected.
+    restart_policy = RestartPolicy(max_restarts=0) if args.replay else RestartPolicy()
+
+    def replay_finished(client):
+        # The end of a replay is the end of the recording, not a lost strap: stop it rather than let it fail.
+        session.straps[client.address].device.stop()
+
+    packet_logs = {}
+    if args.log_packets:
+        from Polar_Lib.FakeClient import PacketLog
+        for address in addresses:
+            path = os.path.splitext(output_paths(args, address)["ecg"])[0] + "_packets.jsonl"
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            packet_logs[address] = PacketLog(path)
+            print("{0} packets -> {1}".format(address, path))
+
+    session = H10Session(addresses, restart_policy=restart_policy, acc_sampling_frequency=args.acc,
+                         client_factory=client_factory(args, replay_finished, packet_logs))
+
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGINT, session.stop)
+        loop.add_signal_handler(signal.SIGTERM, session.stop)
+    except NotImplementedError:
+        pass  # Windows: Ctrl-C raises KeyboardInterrupt instead
+
+    first_sample = loop.create_future()
+    writers = []
+    telemetry_dumps = []
+    for address, device in session.devices.items():
+        paths = output_paths(args, address)
+        for stream, path in paths.items():
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            subscription = device.stream(stream, maxsize=256, overflow=OverflowPolicy.COALESCE)
+            writers.append(asyncio.ensure_future(write_stream(subscription, path, first_sample)))
+            print("{0} {1} -> {2}".format(address, stream.upper(), path))
+        if args.telemetry > 0:
+            telemetry_path = os.path.splitext(paths["ecg"])[0] + "_telemetry.jsonl"
+            telemetry_dumps.append(asyncio.ensure_future(
+                device.telemetry.dump_periodically(telemetry_path, args.telemetry, mac_address=address)))
+
+    if args.duration:
+        loop.call_later(args.duration, session.stop)
+    if args.startup_report:
+        first_sample.add_done_callback(lambda f: print("First sample after {0:.3f} s".format(f.result() - _START)))
+
+    await session.run()
+    # The streams end with the session, so the writers finish on their own once they have drained them.
+    await asyncio.gather(*writers)
+    for task in telemetry_dumps:
+        task.cancel()
+    await asyncio.gather(*telemetry_dumps, return_exceptions=True)
+    for log in packet_logs.values():
+        log.close()
+    for address, snapshot in session.snapshot().items():
+        print("{0}: {1}, {2} ECG samples, {3} gap(s)".format(address, snapshot["status"], snapshot["ecg_samples"],
+                                                             snapshot["gaps"]))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.startup_report:
+        print("Imports done after {0:.3f} s".format(time.perf_counter() - _START))
+    try:
+        asyncio.run(record(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
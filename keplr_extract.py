@@ -2,10 +2,12 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 import pandas as pd
 import os
-import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 
+from Polar_Lib.Converters import CONVERT_STATUS, convert_cached
+from Polar_Lib.TraceViewer import TraceViewer
+
 class KeplrExtractApp:
     def __init__(self, root):
         self.root = root
@@ -15,6 +17,8 @@ class KeplrExtractApp:
         self.processed_path = None
         self.plot_window_eeg = None
         self.plot_window_processed = None
+        self.viewer_eeg = None
+        self.viewer_processed = None
         self.selected_columns = []
 
         self.select_button = tk.Button(root, text="Select CSV File", command=self.select_file)
@@ -48,73 +52,13 @@ class KeplrExtractApp:
         if not self.file_path:
             messagebox.showerror("Error", "No file selected.")
             return
-        df = pd.read_csv(self.file_path, sep=';', low_memory=False)
-        # EEG extraction
-        eeg_raw_cols = [col for col in df.columns if col.startswith('Bio_EEG_RAW')]
-        if 'Bio_Time' not in df.columns or not eeg_raw_cols:
-            messagebox.showerror("Error", "Required EEG columns not found.")
-            return
-        # Only keep Bio_Time and EEG_RAW* columns for EEG extraction
-        eeg_cols = ['Bio_Time'] + eeg_raw_cols
-        df_eeg = df[eeg_cols].drop_duplicates(subset=eeg_cols)
-        df_eeg = df_eeg.sort_values('Bio_Time')
-        eeg_output = []
-        sample_rate = 1024.0
-        # Parse Bio_Time as seconds since start
-        def parse_time_to_seconds(t):
-            import re
-            if pd.isnull(t):
-                return None
-            if isinstance(t, (int, float)):
-                return float(t)
-            t = str(t).strip()
-            # Try to parse hh:mm:ss(.ms) or mm:ss(.ms) or ss(.ms)
-            parts = re.split(r'[:]', t)
-            try:
-                parts = [float(p) for p in parts]
-            except Exception:
-                return None
-            if len(parts) == 3:
-                return parts[0]*3600 + parts[1]*60 + parts[2]
-            elif len(parts) == 2:
-                return parts[0]*60 + parts[1]
-            elif len(parts) == 1:
-                return parts[0]
-            return None
-        # Compute offset so time starts at zero
-        times = df_eeg['Bio_Time'].map(parse_time_to_seconds)
-        if times.isnull().all():
-            messagebox.showerror("Error", "Could not parse any Bio_Time values. Check the time format.")
-            return
-        time_offset = times.dropna().iloc[0] if not times.dropna().empty else 0.0
-        for idx, row in df_eeg.iterrows():
-            base_ts = parse_time_to_seconds(row['Bio_Time'])
-            if base_ts is None:
-                continue
-            base_ts -= time_offset
-            for i, col in enumerate(eeg_raw_cols):
-                ts = base_ts + i / sample_rate
-                val = row[col]
-                if pd.notnull(val):
-                    eeg_output.append((ts, val))
-        eeg_output = sorted(set(eeg_output), key=lambda x: x[0])
-        with open(self.eeg_path, 'w') as f:
-            f.write('timestamp,value\n')
-            for ts, val in eeg_output:
-                f.write(f'{ts},{val}\n')
-        # Processed extraction
-        processed_cols = ['Bio_Time', 'Bio_Focus', 'Bio_Agitation', 'Bio_Delta', 'Bio_Theta', 'Bio_Beta', 'Bio_Alpha', 'Bio_Gamma']
-        missing = [col for col in processed_cols if col not in df.columns]
-        if missing:
-            messagebox.showerror("Error", f"Missing processed columns: {', '.join(missing)}")
+        try:
+            # Skipped when the export did not change since the last conversion, only its new rows if it grew
+            (self.eeg_path, self.processed_path), how = convert_cached("keplr", self.file_path)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
-        df_proc = df[processed_cols].drop_duplicates(subset=['Bio_Time']).sort_values('Bio_Time').copy()
-        # Convert Bio_Time to seconds since start for processed features
-        proc_times = df_proc['Bio_Time'].map(parse_time_to_seconds)
-        proc_offset = proc_times.dropna().iloc[0] if not proc_times.dropna().empty else 0.0
-        df_proc['Bio_Time'] = proc_times - proc_offset
-        df_proc.to_csv(self.processed_path, index=False)
-        self.status_label.config(text=f'Converted: {os.path.basename(self.eeg_path)}, {os.path.basename(self.processed_path)}')
+        self.status_label.config(text=f'{CONVERT_STATUS[how]}: {os.path.basename(self.eeg_path)}, {os.path.basename(self.processed_path)}')
         self.plot_eeg_button.config(state=tk.NORMAL)
         self.plot_processed_button.config(state=tk.NORMAL)
 
@@ -127,9 +71,12 @@ class KeplrExtractApp:
             self.plot_window_eeg.lift()
             return
         self.plot_window_eeg = tk.Toplevel(self.root)
-        self.plot_window_eeg.title("EEG Plot - Seaborn/Matplotlib")
+        self.plot_window_eeg.title("EEG Plot - Matplotlib")
         fig, ax = plt.subplots(figsize=(10, 4))
-        sns.lineplot(x=df['timestamp'], y=df['value'], ax=ax)
+        # Only the detail visible at the current zoom is drawn, so a 24 h recording at 1024 Hz stays responsive
+        self.viewer_eeg = TraceViewer(ax)
+        self.viewer_eeg.add_trace("EEG", df['timestamp'].to_numpy(), df['value'].to_numpy())
+        self.viewer_eeg.show_all()
         ax.set_title("EEG Signal")
         ax.set_xlabel("Timestamp (s)")
         ax.set_ylabel("EEG Value")
@@ -149,22 +96,25 @@ class KeplrExtractApp:
             self.plot_window_processed.lift()
             return
         self.plot_window_processed = tk.Toplevel(self.root)
-        self.plot_window_processed.title("Processed Plot - Seaborn/Matplotlib")
+        self.plot_window_processed.title("Processed Plot - Matplotlib")
         # Column selection
         col_frame = tk.Frame(self.plot_window_processed)
         col_frame.pack(side="top", fill="x")
         var_dict = {}
-        def update_plot(*_):
-            selected = [col for col, var in var_dict.items() if var.get()]
-            ax.clear()
-            for col in selected:
-                ax.plot(df['Bio_Time'], df[col], label=col)
-            ax.set_title("Processed EEG Features")
-            ax.set_xlabel("Bio_Time (s)")
-            ax.set_ylabel("Value")
-            ax.legend()
-            canvas.draw()
         fig, ax = plt.subplots(figsize=(10, 4))
+        # Every feature is plotted once; the checkboxes only show or hide its line
+        self.viewer_processed = TraceViewer(ax)
+        for col in df.columns:
+            if col == 'Bio_Time':
+                continue
+            self.viewer_processed.add_trace(col, df['Bio_Time'].to_numpy(), df[col].to_numpy())
+        def update_plot(*_):
+            for col, var in var_dict.items():
+                self.viewer_processed.set_visible(col, var.get())
+            self.viewer_processed.autoscale_y()
+            visible = [self.viewer_processed.traces[col][1] for col, var in var_dict.items() if var.get()]
+            ax.legend(handles=visible)
+            canvas.draw_idle()
         for i, col in enumerate(df.columns):
             if col == 'Bio_Time':
                 continue
@@ -172,6 +122,10 @@ class KeplrExtractApp:
             var_dict[col] = var
             cb = tk.Checkbutton(col_frame, text=col, variable=var, command=update_plot)
             cb.pack(side="left")
+        ax.set_title("Processed EEG Features")
+        ax.set_xlabel("Bio_Time (s)")
+        ax.set_ylabel("Value")
+        self.viewer_processed.show_all()
         canvas = FigureCanvasTkAgg(fig, master=self.plot_window_processed)
         canvas.draw()
         canvas.get_tk_widget().pack(fill="both", expand=True)
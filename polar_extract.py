@@ -4,10 +4,12 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 import pandas as pd
 import os
-import seaborn as sns
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
+from Polar_Lib.Converters import CONVERT_STATUS, convert_cached
+from Polar_Lib.TraceViewer import TraceViewer
+
 
 class PolarExtractApp:
     def __init__(self, root):
@@ -25,6 +27,7 @@ class PolarExtractApp:
         self.plot_button = tk.Button(root, text="View Plot", command=self.plot, state=tk.DISABLED)
         self.plot_button.pack(pady=5)
         self.plot_window = None
+        self.viewer = None
 
         self.status_label = tk.Label(root, text="No file selected.")
         self.status_label.pack(pady=10)
@@ -46,32 +49,13 @@ class PolarExtractApp:
         if not self.file_path:
             messagebox.showerror("Error", "No file selected.")
             return
-        df = pd.read_csv(self.file_path, sep=';', low_memory=False)
-        ecg_raw_cols = [col for col in df.columns if col.startswith('Bio_ECG_RAW')]
-        if 'Bio_ECG_Timestamp' not in df.columns or not ecg_raw_cols:
-            messagebox.showerror("Error", "Required columns not found.")
+        try:
+            # Skipped when the export did not change since the last conversion, only its new rows if it grew
+            (self.converted_path,), how = convert_cached("polar", self.file_path)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
-        df = df.drop_duplicates(subset=['Bio_ECG_Timestamp'] + ecg_raw_cols)
-        df = df.sort_values('Bio_ECG_Timestamp')
-        output = []
-        sample_rate = 130.0
-        time_add = 1/sample_rate
-        for _, row in df.iterrows():
-            try:
-                base_ts = float(row['Bio_ECG_Timestamp'])
-            except Exception:
-                continue
-            for i, col in enumerate(ecg_raw_cols):
-                ts = base_ts + i * time_add
-                val = row[col]
-                if pd.notnull(val):
-                    output.append((ts, val))
-        output = sorted(set(output), key=lambda x: x[0])
-        with open(self.converted_path, 'w') as f:
-            f.write('timestamp,value\n')
-            for ts, val in output:
-                f.write(f'{ts},{val}\n')
-        self.status_label.config(text=f'Converted: {os.path.basename(self.converted_path)}')
+        self.status_label.config(text=f'{CONVERT_STATUS[how]}: {os.path.basename(self.converted_path)}')
         self.plot_button.config(state=tk.NORMAL)
 
     def plot(self):
@@ -83,9 +67,12 @@ class PolarExtractApp:
             self.plot_window.lift()
             return
         self.plot_window = tk.Toplevel(self.root)
-        self.plot_window.title("ECG Plot - Seaborn/Matplotlib")
+        self.plot_window.title("ECG Plot - Matplotlib")
         fig, ax = plt.subplots(figsize=(10, 4))
-        sns.lineplot(x=df['timestamp'], y=df['value'], ax=ax)
+        # Only the detail visible at the current zoom is drawn, so panning a whole day stays responsive
+        self.viewer = TraceViewer(ax)
+        self.viewer.add_trace("ECG", df['timestamp'].to_numpy(), df['value'].to_numpy())
+        self.viewer.show_all()
         ax.set_title("ECG Signal")
         ax.set_xlabel("Timestamp (s)")
         ax.set_ylabel("ECG Value")